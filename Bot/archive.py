@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+# Flight Archive: many flights in one KML, as a Region/NetworkLink tile tree with per-flight levels of detail
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from base import settings
+from batch import find_igc_files
+from kmls import time_ordered_track, track_points, kml_thresholds, kml_styles, kml_markers, iter_colored_blocks, \
+    kml_segment, WRITE_BUFFER
+
+# Levels of detail: (simplification tolerance m, minLodPixels, maxLodPixels) per flight,
+# coarse to fine; the finest level also carries the thermal/takeoff/landing markers
+LOD_LEVELS = ((250.0, 24, 512),
+              (40.0, 512, 2048),
+              (settings["kml_tolerance_m"], 2048, -1))
+MAX_TILE_DEPTH = 12  # quadtree depth limit (~0.09 x 0.04 deg tiles)
+TILE_MIN_LOD_PIXELS = 128  # a child tile loads once its region covers this many pixels
+WORLD = (90.0, -90.0, 180.0, -180.0)  # north, south, east, west
+MANIFEST = "archive.json"
+KML_OPEN = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2"\n'
+            '     xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+            '<Document>\n')
+KML_CLOSE = '</Document>\n</kml>\n'
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def flight_id(igc_file):
+    # stable & unique per source path: <stem>-<path hash>
+    path = os.path.abspath(igc_file)
+    return f"{Path(path).stem}-{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+
+
+def flight_bbox(blocks):
+    lons = [p[0] for _, block, _ in blocks for p in block]
+    lats = [p[1] for _, block, _ in blocks for p in block]
+    return [max(lats), min(lats), max(lons), min(lons)]  # north, south, east, west
+
+
+def tile_key(bbox, max_depth=MAX_TILE_DEPTH):
+    # deepest quadtree tile holding the whole bbox: "" is the world, each digit picks a quadrant
+    north, south, east, west = bbox
+    key = ""
+    t_north, t_south, t_east, t_west = WORLD
+    while len(key) < max_depth:
+        mid_lat, mid_lon = (t_north + t_south) / 2, (t_east + t_west) / 2
+        if south >= mid_lat:
+            row, t_south = 0, mid_lat
+        elif north < mid_lat:
+            row, t_north = 1, mid_lat
+        else:
+            break
+        if west >= mid_lon:
+            col, t_west = 1, mid_lon
+        elif east < mid_lon:
+            col, t_east = 0, mid_lon
+        else:
+            break
+        key += str(row * 2 + col)
+    return key
+
+
+def tile_bounds(key):
+    north, south, east, west = WORLD
+    for digit in key:
+        row, col = divmod(int(digit), 2)
+        mid_lat, mid_lon = (north + south) / 2, (east + west) / 2
+        north, south = (north, mid_lat) if row == 0 else (mid_lat, south)
+        east, west = (east, mid_lon) if col == 1 else (mid_lon, west)
+    return north, south, east, west
+
+
+def region(bbox, min_pixels, max_pixels=-1):
+    north, south, east, west = bbox
+    return ('<Region><LatLonAltBox>'
+            f'<north>{north}</north><south>{south}</south><east>{east}</east><west>{west}</west>'
+            f'</LatLonAltBox><Lod><minLodPixels>{min_pixels}</minLodPixels><maxLodPixels>{max_pixels}</maxLodPixels>'
+            '</Lod></Region>\n')
+
+
+def network_link(name, href, region_kml):
+    return (f'<NetworkLink><name>{name}</name>\n{region_kml}'
+            f'<Link><href>{href}</href><viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>\n')
+
+
+def write_if_changed(path, text):
+    # rewrite only what changed, so an incremental run leaves untouched tiles (and their mtimes) alone
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return True
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def archive_settings():
+    # anything that changes the level files; a change rebuilds every flight
+    return {"levels": [list(level) for level in LOD_LEVELS], "decimals": settings["kml_decimals"],
+            "max_tile_depth": MAX_TILE_DEPTH}
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def export_flight(igc_file, flight_dir):
+    # one kml per level of detail in flight_dir; returns the manifest entry
+    from cache import load_igc_cached
+    results = load_igc_cached(igc_file)
+    kml_data = results["kml_data"]
+    track = time_ordered_track(kml_data)
+    alt_thresholds = kml_thresholds(int(x[2]) for x in track_points(kml_data, track))
+    if alt_thresholds is None:
+        raise ValueError(f"No altitudes in {igc_file}")
+
+    decimals = settings["kml_decimals"]
+    fmt = lambda x: str(round(x, decimals))
+    blocks = []
+    for color, block, stamps in iter_colored_blocks(kml_data, track, alt_thresholds):
+        block = [p for p in block if p[0] or p[1]]  # no-fix records at 0,0 would stretch the bbox across the globe
+        if block:
+            blocks.append((color, block, stamps))
+    os.makedirs(flight_dir, exist_ok=True)
+    points = []
+    for level, (tolerance_m, _, _) in enumerate(LOD_LEVELS):
+        stats = {}
+        with open(os.path.join(flight_dir, f"lod{level}.kml"), "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+            f.write(KML_OPEN + kml_styles())
+            if level == len(LOD_LEVELS) - 1:
+                f.write(kml_markers(kml_data, fmt))
+            for number, (color, block, _) in enumerate(blocks, 1):
+                f.write(kml_segment(number, color, block, fmt, tolerance_m, stats))
+            f.write(KML_CLOSE)
+        points.append(stats["kept"])
+
+    return {"name": escape(f"{results['pilot']} {results['takeoff_datetime']}".strip()),
+            "bbox": flight_bbox(blocks),
+            "points": points}
+
+
+def tile_document(key, children, flights):
+    # one tile: NetworkLinks to its child tiles & to the levels of the flights that live at this tile
+    parts = [KML_OPEN, f'<name>tile {key or "world"}</name>\n']
+    for child in children:
+        parts.append(network_link(f"tile {child}", f"t{child}.kml",
+                                  region(tile_bounds(child), TILE_MIN_LOD_PIXELS)))
+    for fid, entry in flights:
+        parts.append(f'<Folder><name>{entry["name"]}</name>\n')
+        for level, (_, min_pixels, max_pixels) in enumerate(LOD_LEVELS):
+            parts.append(network_link(f"lod {level}", f"../flights/{fid}/lod{level}.kml",
+                                      region(entry["bbox"], min_pixels, max_pixels)))
+        parts.append('</Folder>\n')
+    parts.append(KML_CLOSE)
+    return "".join(parts)
+
+
+def write_tiles(flights, out_dir):
+    # the quadtree down to every flight's tile; returns the number of tile files written
+    tiles_dir = os.path.join(out_dir, "tiles")
+    os.makedirs(tiles_dir, exist_ok=True)
+    at_tile = {}
+    for fid in sorted(flights):
+        entry = flights[fid]
+        if "bbox" in entry:
+            at_tile.setdefault(entry["tile"], []).append((fid, entry))
+    keys = {key[:depth] for key in at_tile for depth in range(len(key) + 1)} | {""}
+    children = {}
+    for key in keys:
+        if key:
+            children.setdefault(key[:-1], []).append(key)
+
+    written = 0
+    for key in keys:
+        text = tile_document(key, sorted(children.get(key, [])), at_tile.get(key, []))
+        written += write_if_changed(os.path.join(tiles_dir, f"t{key}.kml"), text)
+    for name in os.listdir(tiles_dir):  # tiles left empty by removed flights
+        if name[1:-4] not in keys:
+            os.remove(os.path.join(tiles_dir, name))
+    root = (KML_OPEN + '<name>Flight Archive</name>\n'
+            + network_link("flights", "tiles/t.kml", region(WORLD, 0)) + KML_CLOSE)
+    written += write_if_changed(os.path.join(out_dir, "archive.kml"), root)
+    return written
+
+
+def build_archive(files, out_dir, log=None):
+    # (re)builds out_dir/archive.kml for files; only new or changed flights are exported again and
+    # flights no longer listed are dropped. Returns counts.
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    if manifest.get("settings") != archive_settings():
+        manifest = {"settings": archive_settings(), "flights": {}}
+    flights = manifest["flights"]
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+
+    listed = set()
+    for igc_file in files:
+        fid = flight_id(igc_file)
+        listed.add(fid)
+        stat = os.stat(igc_file)
+        source = {"source": os.path.abspath(igc_file), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        entry = flights.get(fid)
+        if entry is not None and all(entry.get(k) == v for k, v in source.items()):
+            counts["unchanged"] += 1
+            continue
+        try:
+            entry = {**source, **export_flight(igc_file, os.path.join(out_dir, "flights", fid))}
+            entry["tile"] = tile_key(entry["bbox"])
+            counts["updated" if fid in flights else "added"] += 1
+        except Exception as e:  # kept in the manifest so the same bad file is not retried every run
+            entry = {**source, "error": f"{type(e).__name__}: {e}"}
+            counts["failed"] += 1
+        flights[fid] = entry
+        if log:
+            log(f"{igc_file}: {entry.get('error') or entry['points']}")
+
+    for fid in set(flights) - listed:
+        shutil.rmtree(os.path.join(out_dir, "flights", fid), ignore_errors=True)
+        del flights[fid]
+        counts["removed"] += 1
+
+    counts["tiles_written"] = write_tiles(flights, out_dir)
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update a level-of-detail KML archive of IGC flights.")
+    parser.add_argument("paths", nargs="+", help="IGC files, globs or directories (the whole archive)")
+    parser.add_argument("-o", "--output", default="Archive", help="archive directory (default: Archive)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print each exported flight")
+    args = parser.parse_args()
+
+    files = find_igc_files(args.paths)
+    if not files:
+        print("No IGC files found.", file=sys.stderr)
+        return 1
+    log = (lambda line: print(line, file=sys.stderr)) if args.verbose else None
+    counts = build_archive(files, args.output, log)
+    print(", ".join(f"{v} {k.replace('_', ' ')}" for k, v in counts.items()), file=sys.stderr)
+    print(os.path.join(args.output, "archive.kml"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,25 @@
 # Base Functions
 import datetime
 import datetime as dt
+from array import array
+from itertools import repeat
 
 from math import asin, atan2, degrees, cos, radians, sin, sqrt
 
+try:  # batch kernels use NumPy when it is installed
+    import numpy as np
+except ImportError:
+    np = None
+
 # Constants -------------------------------------/
 settings = {"averaging_factor": 10,
             "climb_ascend_threshold": 0.5,
             "sink_descend_threshold": 2.5,
-            "kmz_speed_units": "kmh"}
+            "kmz_speed_units": "kmh",
+            "kml_decimals": 6,  # coordinate decimals in kml/kmz output (6: ~0.1 m, IGC fixes are ~1.9 m)
+            "kml_tolerance_m": 5.0,  # track simplification tolerance in kml/kmz output (0: every fix)
+            "kml_track_step_s": 5}  # seconds between fixes in animated (gx:Track) output (0/1: every fix)
+EARTH_RADIUS_KM = 6372.8
 
 
 # Helper & Conversion Functions ---------------------------------------------------|
@@ -57,14 +68,67 @@ def haversine(loc1, loc2):
     a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
     c = 2 * asin(sqrt(a))  # formula 1
     # c = 2 * atan2(sqrt(a), sqrt(1 - a))  # formula 2
-    r = 6372.8  # for km. Use 3959.87433 for miles
+    r = EARTH_RADIUS_KM  # for km. Use 3959.87433 for miles
     rtn_val = (c * r)
     return rtn_val
 
 
 def bearing(loc1, loc2):
-    # loc is a (lat, lon) tuple
-    lat1, lon1, lat2, lon2 = loc1[0], loc1[1], loc2[0], loc2[1]
+    # loc is a (lat, lon) tuple in degrees; returns the initial bearing in whole degrees
+    lat1, lon1, lat2, lon2 = map(radians, [loc1[0], loc1[1], loc2[0], loc2[1]])
     bearing = atan2(sin(lon2 - lon1) * cos(lat2), cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(lon2 - lon1))
     bearing = degrees(bearing)
     return int((bearing + 360) % 360)
+
+
+# Batch (array in / array out) Functions ------------------------------------------|
+# lats/lons: sequences in degrees (list, array, memoryview or NumPy array).
+# NumPy input returns NumPy arrays, anything else returns array('d') / array('i').
+def haversine_many(lats1, lons1, lats2, lons2):
+    # element-wise haversine() in km; either side may be a single (scalar) point
+    if np is not None:
+        as_numpy = any(isinstance(x, np.ndarray) for x in (lats1, lons1, lats2, lons2))
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lats1, lons1, lats2, lons2))
+        dlon = (lon2 - lon1)
+        dlat = (lat2 - lat1)
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        distances = 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+        return distances if as_numpy else array("d", np.atleast_1d(distances).tobytes())
+
+    pairs = _broadcast(lats1, lons1, lats2, lons2)
+    return array("d", (haversine((lat1, lon1), (lat2, lon2)) for lat1, lon1, lat2, lon2 in pairs))
+
+
+def bearing_many(lats1, lons1, lats2, lons2):
+    # element-wise bearing() in whole degrees
+    if np is not None:
+        as_numpy = any(isinstance(x, np.ndarray) for x in (lats1, lons1, lats2, lons2))
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lats1, lons1, lats2, lons2))
+        b = np.arctan2(np.sin(lon2 - lon1) * np.cos(lat2),
+                       np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1))
+        bearings = ((np.degrees(b) + 360) % 360).astype(np.int64)
+        return bearings if as_numpy else array("i", np.atleast_1d(bearings).astype(np.intc).tobytes())
+
+    pairs = _broadcast(lats1, lons1, lats2, lons2)
+    return array("i", (bearing((lat1, lon1), (lat2, lon2)) for lat1, lon1, lat2, lon2 in pairs))
+
+
+def haversine_steps(lats, lons):
+    # distance (km) from each fix to the next: len(lats) - 1 values
+    return haversine_many(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def bearing_steps(lats, lons):
+    # bearing from each fix to the next: len(lats) - 1 values
+    return bearing_many(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def haversine_from(origin, lats, lons):
+    # distance (km) from a fixed (lat, lon) origin to every fix, e.g. for the flight area
+    return haversine_many(origin[0], origin[1], lats, lons)
+
+
+def _broadcast(*columns):
+    # pure Python zip() that repeats scalar arguments
+    size = max((len(c) for c in columns if not isinstance(c, (int, float))), default=1)
+    return zip(*(repeat(c, size) if isinstance(c, (int, float)) else c for c in columns))
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+# Batch analysis: many IGC files across a process pool, one summary line per flight
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import timing
+
+# Scalar fields of the load_igc() results, in output order ---------------------------/
+SUMMARY_FIELDS = ["filename", "status", "error", "fixes", "seconds",
+                  "pilot", "vario", "glider", "flight_date", "flight_type", "duration",
+                  "takeoff_datetime", "takeoff_alt", "takeoff_heading",
+                  "landing_datetime", "landing_alt", "landing_heading",
+                  "max_alt", "max_lift", "max_sink", "total_distance", "takeoff_to_land_dist", "flight_area_diameter",
+                  "climbs_num", "glides_num", "sinks_num", "climb_grade", "glide_grade", "sink_grade",
+                  "max_sustained_climb", "µ_sustained_climb", "µ_sustained_glide"]
+
+
+META_FIELDS = ["filename", "status", "error", "fixes", "seconds"]  # filled in by analyze_one()
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def find_igc_files(paths):
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.extend(sorted(glob.glob(str(path / "*.igc")) + glob.glob(str(path / "*.IGC"))))
+        else:
+            files.extend(sorted(glob.glob(str(path))))
+    return files
+
+
+def summarize(results, fields=None):
+    # results are lazy: only the requested fields get computed
+    summary = {}
+    for field in fields or SUMMARY_FIELDS:
+        if field in results:
+            value = results[field]
+            summary[field] = value.isoformat() if isinstance(value, datetime) else value
+    return summary
+
+
+def scan_only(fields):
+    # True when scan_flight() answers every requested field (the cache would parse & analyze on a miss)
+    from result import SCAN_KEYS
+    return all(field in SCAN_KEYS or field in META_FIELDS for field in fields)
+
+
+def analyze_one(igc_file, use_cache=True, write_kml=False, timings=False, profile_dir=None, fields=None):
+    # runs in a worker: a bad file comes back as an error summary instead of raising
+    timing.enable(timings)
+    start = time.perf_counter()
+    try:
+        if use_cache and not (fields and scan_only(fields) and not write_kml):
+            from cache import load_igc_cached as load
+        else:  # load_igc() is lazy: fields from the header scan never parse the whole file
+            from decode import load_igc as load
+        profiler = nullcontext()
+        kml_stats = {}
+        if profile_dir:
+            profiler = timing.profile_to(str(Path(profile_dir) / f"{Path(igc_file).stem}.pstats"))
+        with profiler:
+            results = load(igc_file)
+            if write_kml:
+                from kmls import create_enhanced_kml
+                create_enhanced_kml(results["kml_data"], stats=kml_stats)
+        summary = {"filename": igc_file, **summarize(results, fields)}
+        summary.update({"status": "ok", "fixes": results.fixes})
+        if kml_stats:
+            summary["kml_points"] = kml_stats  # track points written / kept after simplification
+        if "timings" in results:
+            summary["timings"] = results["timings"]
+    except Exception as e:
+        summary = {"filename": igc_file, "status": "error", "error": f"{type(e).__name__}: {e}", "fixes": 0}
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def open_writer(out, fmt, fields=None):
+    if fmt == "csv":
+        columns = list(META_FIELDS)
+        columns += [f for f in fields if f not in columns] if fields else SUMMARY_FIELDS[len(columns):]
+        writer = csv.DictWriter(out, fieldnames=columns, extrasaction="ignore")  # timings: jsonl only
+        writer.writeheader()
+        return writer.writerow
+    return lambda summary: out.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def run_batch(files, write, workers=None, use_cache=True, write_kml=False, timings=False, profile_dir=None,
+              fields=None):
+    # analyzes files across 'workers' processes (1: in this process), write() gets each summary as it
+    # finishes; returns totals
+    totals = {"files": 0, "failed": 0, "fixes": 0}
+    start = time.perf_counter()
+
+    def record(summary):
+        totals["files"] += 1
+        totals["fixes"] += summary["fixes"]
+        if summary["status"] != "ok":
+            totals["failed"] += 1
+        write(summary)
+
+    if workers == 1:
+        for igc_file in files:
+            record(analyze_one(igc_file, use_cache, write_kml, timings, profile_dir, fields))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(analyze_one, igc_file, use_cache, write_kml, timings, profile_dir, fields): igc_file
+                       for igc_file in files}
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as e:  # the worker itself died
+                    summary = {"filename": futures[future], "status": "error",
+                               "error": f"{type(e).__name__}: {e}", "fixes": 0}
+                record(summary)
+
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze IGC files in parallel and write one summary per flight.")
+    parser.add_argument("paths", nargs="+", help="IGC files, globs or directories")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="worker processes (default: all CPUs)")
+    parser.add_argument("-o", "--output", default="-", help="summary file (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None,
+                        help="summary format (default: from the output extension, else jsonl)")
+    parser.add_argument("--kml", action="store_true", help="also write a kml file next to each IGC file")
+    parser.add_argument("--no-cache", action="store_true", help="always re-parse (skip the parse/analysis cache)")
+    parser.add_argument("--fields", type=lambda v: [f for f in v.split(",") if f],
+                        help="comma separated summary fields to compute (default: all scalar fields)")
+    parser.add_argument("--timings", action="store_true", help="add per-stage wall/cpu time & allocations (jsonl)")
+    parser.add_argument("--profile", metavar="DIR", help="write cProfile stats (.pstats & .txt) per flight to DIR")
+    args = parser.parse_args()
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    files = find_igc_files(args.paths)
+    if not files:
+        print("No IGC files found.", file=sys.stderr)
+        return 1
+
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        write_row = open_writer(out, fmt, args.fields)
+
+        def write(summary):
+            write_row(summary)
+            out.flush()
+
+        totals = run_batch(files, write, max(1, args.workers), not args.no_cache, args.kml, args.timings, args.profile,
+                           args.fields)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = totals["seconds"]
+    print(f"{totals['files']} files ({totals['failed']} failed), {totals['fixes']} fixes in {elapsed:.2f}s: "
+          f"{totals['files'] / elapsed:.1f} files/s, {totals['fixes'] / elapsed:,.0f} fixes/s", file=sys.stderr)
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
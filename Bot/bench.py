@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+# Benchmark: row-by-row vs columnar IGC parsing, flight_analyzer() scaling, per-stage suite
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from batch import find_igc_files
+from decode import parse_igc, load_igc, flight_analyzer, compile_results, analyze_glide_performance, \
+    analyze_thermals
+from columnar import parse_igc_columnar, load_igc_columnar
+from incremental import IncrementalAnalyzer
+from kmls import create_enhanced_kml
+from synth import write_igc
+from track import FlightTrack
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_DIRS = [ROOT / "Log", ROOT / "Test_Files"]
+SCALING_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SUITE_DURATIONS = [1800, 7200, 28800]  # airborne seconds of the synthetic flights (1 Hz)
+BASELINE_FILE = ROOT / "Log" / "bench_baseline.json"
+REGRESSION_RATIO = 1.2  # slower than the baseline by more than this is flagged
+FEED_LINES = 60  # IGC lines per IncrementalAnalyzer.feed() in --incremental
+
+
+def best_of(fn, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_full(igc_file, load=load_igc):
+    # load_igc() results are lazy: evaluate every key, as a caller reading the whole report would
+    return dict(load(igc_file))
+
+
+def bench_file(igc_file, repeat=3):
+    fixes = len(parse_igc(igc_file)[1])
+    same = load_igc(igc_file) == load_igc_columnar(igc_file)
+    return {"file": Path(igc_file).name,
+            "fixes": fixes,
+            "parse_s": best_of(parse_igc, igc_file, repeat),
+            "parse_columnar_s": best_of(parse_igc_columnar, igc_file, repeat),
+            "load_s": best_of(load_full, igc_file, repeat),
+            "load_columnar_s": best_of(lambda f: load_full(f, load_igc_columnar), igc_file, repeat),
+            "same_results": same}
+
+
+def bench_incremental(igc_file, feed_lines=FEED_LINES):
+    # feed the file in batches, grading the partial track after each one (from the first fixes on,
+    # before any climb or glide), & check the final grades against flight_analyzer()
+    with open(igc_file, encoding="latin-1") as f:
+        lines = f.read().splitlines()
+    analyzer = IncrementalAnalyzer(igc_file)
+    partial_ok = True
+    start = time.perf_counter()
+    for i in range(0, len(lines), feed_lines):
+        analyzer.feed(lines[i:i + feed_lines])
+        try:
+            analyzer.analysis()
+        except Exception:
+            partial_ok = False
+    elapsed = time.perf_counter() - start
+    final, full = analyzer.analysis(), load_igc(igc_file)
+    feeds = math.ceil(len(lines) / feed_lines)
+    return {"file": Path(igc_file).name,
+            "fixes": analyzer.fixes,
+            "feeds": feeds,
+            "per_feed_s": elapsed / feeds,
+            "partial_ok": partial_ok,
+            "same_results": all(final[k] == full[k] for k in ("climb_grade", "glide_grade", "sink_grade", "details"))}
+
+
+def synthetic_track(fixes, seed=0):
+    # 1 Hz track alternating long climbs, glides & sinks (long uniform phases are the worst case
+    # for per-block list building)
+    rng = random.Random(seed)
+    track = FlightTrack()
+    lat, lon, alt, heading = 45.0, 6.0, 1500, 0.0
+    phase, left = "G", 0
+    for i in range(fixes):
+        if left == 0:
+            phase, left = rng.choice("CCGGS"), rng.randint(60, 1200)
+        left -= 1
+        alt += {"C": rng.randint(0, 4), "G": rng.randint(-2, 1), "S": rng.randint(-6, -2)}[phase]
+        heading = (heading + (25 if phase == "C" else rng.uniform(-2, 2))) % 360
+        step = 0.004 if phase == "C" else 0.012
+        lat += step / 111.2 * math.cos(math.radians(heading))
+        lon += step / 78.6 * math.sin(math.radians(heading))
+        track.append((10125010000 + i, lat, lon, alt, heading, step))
+    return track
+
+
+def bench_scaling(sizes, repeat=1):
+    print(f"{'Fixes':>9} {'Blocks':>7} {'Analyze':>10} {'per fix':>9}")
+    for size in sizes:
+        track = synthetic_track(size)
+        blocks = len(flight_analyzer(track)["details"])
+        elapsed = best_of(flight_analyzer, track, repeat)
+        print(f"{size:>9} {blocks:>7} {elapsed * 1000:>8.1f}ms {elapsed / size * 1e6:>7.2f}us")
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def suite_stages(igc_file):
+    # stage -> callable; each stage's inputs come from one untimed load
+    flight, track = parse_igc(igc_file)
+    analysis = flight_analyzer(track, flight["flight_area_km"])
+    results = compile_results(igc_file, flight, analysis, track)
+    details = analysis["details"]
+    return {"parse_igc": lambda: parse_igc(igc_file),
+            "flight_analyzer": lambda: flight_analyzer(track, flight["flight_area_km"]),
+            "compile_results": lambda: compile_results(igc_file, flight, analysis, track),
+            "analyze_glide_performance": lambda: analyze_glide_performance(details, results["glider"]),
+            "analyze_thermals": lambda: analyze_thermals(details),
+            "create_enhanced_kml": lambda: create_enhanced_kml(results["kml_data"]),
+            "load_igc": lambda: load_full(igc_file),
+            "load_igc_scan": lambda: load_igc(igc_file)}  # the lazy header / takeoff-landing scan only
+
+
+def bench_suite(durations, repeat=3):
+    # times & peak memory of every stage on synthetic flights of the given durations
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in durations:
+            igc_file = write_igc(str(Path(tmp) / f"synthetic_{duration}s.igc"), duration_s=duration,
+                                 thermals=max(1, duration // 1200))
+            stages = suite_stages(igc_file)
+            run = {"duration_s": duration, "fixes": len(parse_igc(igc_file)[1]), "stages": {}}
+            for name, fn in stages.items():
+                run["stages"][name] = {"seconds": best_of(lambda _: fn(), None, repeat),
+                                       "peak_bytes": peak_memory(fn)}
+            runs.append(run)
+    return {"created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "runs": runs}
+
+
+def print_suite(suite, baseline=None):
+    previous = {}
+    for run in (baseline or {}).get("runs", []):
+        for name, stage in run["stages"].items():
+            previous[(run["duration_s"], name)] = stage
+    slower = 0
+    print(f"{'Fixes':>7} {'Stage':<26} {'Time':>10} {'Peak mem':>10} {'vs base':>8}")
+    for run in suite["runs"]:
+        for name, stage in run["stages"].items():
+            line = f"{run['fixes']:>7} {name:<26} {stage['seconds'] * 1000:>8.1f}ms {stage['peak_bytes'] / 1024:>8.0f}KB"
+            base = previous.get((run["duration_s"], name))
+            if base:
+                ratio = stage["seconds"] / base["seconds"]
+                flag = ""
+                if ratio > REGRESSION_RATIO:
+                    flag = "  SLOWER"
+                    slower += 1
+                line += f" {ratio:>7.2f}x{flag}"
+            print(line)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row-by-row and columnar IGC parsing.")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_DIRS, help="IGC files, globs or directories")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    parser.add_argument("--scaling", nargs="*", type=int, metavar="FIXES",
+                        help=f"time flight_analyzer() on synthetic tracks (default sizes: {SCALING_SIZES})")
+    parser.add_argument("--suite", nargs="*", type=int, metavar="SECONDS",
+                        help=f"time every analysis stage on synthetic flights (default durations: {SUITE_DURATIONS})")
+    parser.add_argument("--incremental", nargs="?", type=int, const=FEED_LINES, metavar="LINES",
+                        help=f"feed each file to IncrementalAnalyzer LINES at a time (default {FEED_LINES}), "
+                             "grading after every feed")
+    parser.add_argument("--save", nargs="?", const=BASELINE_FILE, metavar="JSON",
+                        help=f"save the suite results as a baseline (default {BASELINE_FILE.relative_to(ROOT)})")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_FILE, metavar="JSON",
+                        help="compare the suite results against a saved baseline")
+    args = parser.parse_args()
+
+    if args.suite is not None:
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        suite = bench_suite(args.suite or SUITE_DURATIONS, args.repeat)
+        slower = print_suite(suite, baseline)
+        if args.save:
+            Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.save, "w") as f:
+                json.dump(suite, f, indent=2)
+        return 1 if slower else 0
+
+    if args.scaling is not None:
+        bench_scaling(args.scaling or SCALING_SIZES, args.repeat)
+        return
+
+    files = find_igc_files(args.paths)
+    if not files:
+        print("No IGC files found.")
+        return
+
+    if args.incremental is not None:
+        print(f"{'File':<32} {'Fixes':>7} {'Feeds':>6} {'per feed':>9}  Partial  Same")
+        failed = 0
+        for igc_file in files:
+            r = bench_incremental(igc_file, args.incremental)
+            failed += not (r["partial_ok"] and r["same_results"])
+            print(f"{r['file'][:32]:<32} {r['fixes']:>7} {r['feeds']:>6} {r['per_feed_s'] * 1000:>7.2f}ms  "
+                  f"{'ok' if r['partial_ok'] else 'ERROR':<7}  {'yes' if r['same_results'] else 'NO'}")
+        return 1 if failed else 0
+
+    print(f"{'File':<32} {'Fixes':>7} {'Parse':>9} {'Columnar':>9} {'x':>6} {'Load':>9} {'Columnar':>9} {'x':>6}  Same")
+    for igc_file in files:
+        r = bench_file(igc_file, args.repeat)
+        print(f"{r['file'][:32]:<32} {r['fixes']:>7} "
+              f"{r['parse_s'] * 1000:>7.1f}ms {r['parse_columnar_s'] * 1000:>7.1f}ms {r['parse_s'] / r['parse_columnar_s']:>5.1f}x "
+              f"{r['load_s'] * 1000:>7.1f}ms {r['load_columnar_s'] * 1000:>7.1f}ms {r['load_s'] / r['load_columnar_s']:>5.1f}x  "
+              f"{'yes' if r['same_results'] else 'NO'}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# Parse / Analysis Cache
+import hashlib
+import io
+import json
+import os
+import pickle
+import zlib
+from pathlib import Path
+
+from base import settings
+from decode import parse_igc, flight_analyzer, compile_results, read_source, source_name
+from timing import collect, stage
+
+# Constants -------------------------------------/
+CACHE_DIR = Path(os.getenv("IGC_CACHE_DIR", Path(__file__).parent.parent / "Log" / ".cache"))
+CACHE_MAX_BYTES = int(os.getenv("IGC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_VERSION = 5  # bump when parse/analysis output changes
+ANALYSIS_SETTINGS = ("averaging_factor", "climb_ascend_threshold", "sink_descend_threshold")  # kml_* only affect output
+
+stats = {"hits": 0, "misses": 0, "evictions": 0, "errors": 0}
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def cache_key(igc_bytes):
+    # content hash + the analysis settings it was computed with
+    digest = hashlib.sha256(igc_bytes)
+    used = {k: settings[k] for k in ANALYSIS_SETTINGS}
+    digest.update(json.dumps({"version": CACHE_VERSION, "settings": used}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def cache_stats():
+    lookups = stats["hits"] + stats["misses"]
+    summary = dict(stats)
+    summary["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    summary["entries"] = len(list(CACHE_DIR.glob("*.bin"))) if CACHE_DIR.exists() else 0
+    return summary
+
+
+def _read_entry(path):
+    with open(path, "rb") as f:
+        entry = pickle.loads(zlib.decompress(f.read()))
+    os.utime(path)  # mark as recently used
+    return entry
+
+
+def _write_entry(path, entry):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")  # workers may store the same file at the same time
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), 6))
+    os.replace(tmp, path)
+
+
+def evict(max_bytes=None):
+    # least recently used entries go first until the cache fits in max_bytes
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in CACHE_DIR.glob("*.bin"):
+        st = path.stat()
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        stats["evictions"] += 1
+
+
+def clear():
+    for path in CACHE_DIR.glob("*.bin"):
+        path.unlink(missing_ok=True)
+
+
+def read_bytes(source):
+    content = read_source(source)
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return bytes(content)
+    if isinstance(content, list):  # text stream lines
+        return "".join(content).encode("utf-8")
+    with open(content, "rb") as f:
+        return f.read()
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def load_igc_cached(in_igc_file, name=None):
+    # load_igc() with the parsed FlightTrack & flight_analyzer() results cached on disk by content hash;
+    # in_igc_file: path, IGC content as bytes, or a file-like object (see load_igc)
+    with collect() as timings:
+        with stage("cache_lookup"):
+            igc_bytes = read_bytes(in_igc_file)
+            path = CACHE_DIR / f"{cache_key(igc_bytes)}.bin"
+
+            entry = None
+            if path.exists():
+                try:
+                    entry = _read_entry(path)
+                except Exception:
+                    stats["errors"] += 1
+                    path.unlink(missing_ok=True)
+
+        if entry is not None:
+            stats["hits"] += 1
+            flight, analysis = entry["flight"], entry["analysis"]
+            track = entry["track"]
+        else:
+            stats["misses"] += 1
+            with stage("parse"):
+                flight, track = parse_igc(io.BytesIO(igc_bytes))
+            analysis = flight_analyzer(track, flight["flight_area_km"])
+            with stage("cache_store"):
+                try:
+                    _write_entry(path, {"flight": flight, "analysis": analysis, "track": track})
+                    evict()
+                except OSError:
+                    stats["errors"] += 1
+
+    return compile_results(in_igc_file, flight, analysis, track, timings, source_name(in_igc_file, name))
@@ -0,0 +1,178 @@
+# Columnar (NumPy) IGC Parser
+from array import array
+
+import numpy as np
+
+from base import settings
+from base import convert_hm_to_dt, haversine_many, haversine_from, bearing_many
+from decode import parse_header_line, compile_results, flight_analyzer
+from timing import collect, stage
+from track import FlightTrack
+
+# B-Record field offsets -------------------------------------/
+# 0 123456 78901234 567890123 4 56789 01234
+# B HHMMSS DDMMmmmN DDDMMmmmE V PPPPP GGGGG
+B_WIDTH = 35
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def _digits(raw, start, end):
+    # fixed-width ASCII digit columns -> int64, honoring a leading '-' (negative altitudes)
+    cols = raw[:, start:end].astype(np.int64)
+    negative = cols[:, 0] == ord("-")
+    cols = cols - ord("0")
+    cols[negative, 0] = 0
+    value = cols @ (10 ** np.arange(end - start - 1, -1, -1, dtype=np.int64))
+    value[negative] *= -1
+    return value
+
+
+def _window_lift_sink(readings, bounds):
+    # calc_lift_sink() for every (start, end) window of readings at once
+    if not bounds:
+        return np.zeros(0)
+    starts = np.array([b[0] for b in bounds], dtype=np.int64)
+    ends = np.array([b[1] for b in bounds], dtype=np.int64)
+    sizes = np.maximum(ends - starts - 1, 0)  # diffs per window
+    group = np.repeat(np.arange(len(bounds)), sizes)
+    index = np.arange(sizes.sum()) - (np.cumsum(sizes) - sizes)[group] + starts[group]
+    steps = readings[index + 1] - readings[index]
+
+    n = sizes.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(group, steps, len(bounds)) / n
+        dev = steps - mean[group]
+        sd = np.sqrt(np.bincount(group, dev * dev, len(bounds)) / (n - 1))
+        inside = (steps > (mean - 2.0 * sd)[group]) & (steps < (mean + 2.0 * sd)[group])
+        kept = np.bincount(group, inside, len(bounds))
+        value = np.bincount(group, steps * inside, len(bounds)) / kept
+    return np.where((sizes >= 2) & (kept > 0), value, 0.0)
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def parse_igc_columnar(in_igc_file):
+    # Same output as decode.parse_igc(), decoding all B-records as NumPy columns
+    with open(in_igc_file, "r") as f:
+        lines = f.readlines()
+
+    header = {"pilot": "", "vario": "", "glider": "", "raw_utc_date": None}
+    b_lines = []
+    b_dates = []  # (first B-record index, raw_utc_date) each time the date changes
+    for line in lines:
+        if line[0] == "H":
+            parse_header_line(line, header)
+        elif line[0] == "B":
+            if not b_dates or b_dates[-1][1] != header["raw_utc_date"]:
+                b_dates.append((len(b_lines), header["raw_utc_date"]))
+            b_lines.append(line[:B_WIDTH].ljust(B_WIDTH, "0"))
+    if not b_lines:
+        raise ValueError(f"No B-records found in {in_igc_file}")
+
+    raw = np.frombuffer("".join(b_lines).encode("ascii"), dtype=np.uint8).reshape(-1, B_WIDTH)
+    n = len(raw)
+
+    # time, date & position
+    raw_time = _digits(raw, 1, 7)
+    secs = raw_time % 100
+    date_prefix = np.empty(n, dtype=np.int64)
+    seg_starts = [s for s, _ in b_dates] + [n]
+    for (start, raw_utc_date), end in zip(b_dates, seg_starts[1:]):
+        date_prefix[start:end] = int(raw_utc_date) * 1000000
+    date_time = date_prefix + raw_time
+
+    lat = _digits(raw, 7, 9) + _digits(raw, 9, 14) / 60000
+    lat[raw[:, 14] == ord("S")] *= -1
+    lon = _digits(raw, 15, 18) + _digits(raw, 18, 23) / 60000
+    lon[raw[:, 23] == ord("W")] *= -1
+
+    alt = _digits(raw, 25, 30)  # pressure altitude
+    gps_alt = _digits(raw, 30, 35)  # gps altitude
+    alt = np.where(alt == 0, gps_alt, alt)
+
+    # step distance from the previous fix
+    last_lat = np.concatenate(([0.0], lat[:-1]))
+    last_lon = np.concatenate(([0.0], lon[:-1]))
+    travelled = haversine_many(last_lat, last_lon, lat, lon)
+    travelled[0] = 0
+    counted = travelled < .3
+    total_distance_km = float(np.cumsum(np.where(counted, travelled, 0.0))[-1])
+    travelled[~counted & (travelled > 25)] = 0
+
+    # heading: only updated on real movement, carried forward otherwise
+    moved = (last_lat != 0.0) & (last_lon != 0.0) & ((last_lat != lat) | (last_lon != lon))
+    if not moved.any():
+        raise ValueError(f"No takeoff detected in {in_igc_file}")
+    headings = bearing_many(last_lat, last_lon, lat, lon)
+    carried = np.maximum.accumulate(np.where(moved, np.arange(n), 0))
+    heading = headings[carried]
+    takeoff = int(np.argmax(moved))
+    heading[:takeoff] = 0
+
+    # flight area from takeoff
+    takeoff_lat, takeoff_lon = float(lat[takeoff]), float(lon[takeoff])
+    airborne = slice(takeoff, n)
+    in_area = (lat[airborne] != 0.0) & (lon[airborne] != 0.0)
+    flight_area_km = 0.00
+    if in_area.any():
+        area = haversine_from((takeoff_lat, takeoff_lon), lat[airborne][in_area], lon[airborne][in_area])
+        flight_area_km = max(flight_area_km, float(area.max()))
+
+    # max lift & sink over 'averaging_factor' windows
+    factor = settings["averaging_factor"]
+    marker = secs % factor == 0
+    readings = alt[~marker].astype(float)
+    bounds = []
+    start = 0
+    for count in np.cumsum(~marker)[marker].tolist():
+        if count - start >= factor:
+            bounds.append((start, count))
+            start = count
+    lift_sink = _window_lift_sink(readings, bounds)
+    high_lift_m = 0.00
+    high_sink_m = 0.00
+    if len(lift_sink):
+        high_lift_m = max(high_lift_m, round(float(lift_sink.max()), 1))
+        high_sink_m = min(high_sink_m, round(float(lift_sink.min()), 1))
+
+    # Typed columns for the analyzer & kml path
+    track = FlightTrack(array("q", date_time.astype(np.int64).tobytes()),
+                        array("d", lat.tobytes()),
+                        array("d", lon.tobytes()),
+                        array("i", alt.astype(np.intc).tobytes()),
+                        array("d", heading.astype(float).tobytes()),
+                        array("d", travelled.tobytes()))
+
+    flight = dict(header)
+    flight.update({"takeoff_dt": convert_hm_to_dt(_date_at(b_dates, takeoff), f"{raw_time[takeoff]:06d}"),
+                   "landing_dt": convert_hm_to_dt(header["raw_utc_date"], f"{raw_time[-1]:06d}"),
+                   "takeoff_lat": takeoff_lat,
+                   "takeoff_lon": takeoff_lon,
+                   "takeoff_alt_m": int(alt[takeoff - 1]),
+                   "takeoff_heading": int(headings[takeoff]),
+                   "landing_lat": float(lat[-1]),
+                   "landing_lon": float(lon[-1]),
+                   "landing_alt_m": int(alt[-1]),
+                   "landing_heading": int(heading[-1]),
+                   "high_alt_m": max(0, int(alt.max())),
+                   "high_lift_m": high_lift_m,
+                   "high_sink_m": high_sink_m,
+                   "total_distance_km": total_distance_km,
+                   "flight_area_km": flight_area_km})
+    return flight, track
+
+
+def _date_at(b_dates, index):
+    raw_utc_date = b_dates[0][1]
+    for start, date in b_dates:
+        if start > index:
+            break
+        raw_utc_date = date
+    return raw_utc_date
+
+
+def load_igc_columnar(in_igc_file):
+    with collect() as timings:
+        with stage("parse"):
+            flight, track = parse_igc_columnar(in_igc_file)
+        analysis = flight_analyzer(track, flight["flight_area_km"])
+    return compile_results(in_igc_file, flight, analysis, track, timings)
@@ -1,12 +1,21 @@
 #!/usr/bin/python3
+import io
 import statistics as stat
+from array import array
+from collections import Counter
+from math import isqrt
+from operator import sub
+from os import PathLike
 
 from base import settings
-from base import convert_hm_to_dt, convert_meters_to_feet, convert_km_to_miles, convert_ms_to_fpm, format_timestamp, \
-    haversine, bearing
+from base import convert_hm_to_dt, convert_meters_to_feet, convert_km_to_miles, convert_ms_to_fpm, haversine, \
+    haversine_many, bearing
+from timing import stage
+from track import FlightTrack
 
 
 MAX_GLIDE_RATIO = 20
+TYYPE_LOOKUP = {"G": "Glide", "C": "Climb", "S": "Sink"}
 
 
 # Reference Functions ---------------------------------------------------------------------------|
@@ -14,41 +23,112 @@ def calc_lift_sink(altitudes: [float]) -> float:
     value = 0
     try:
         meters_per_second = [float(t - s) for s, t in zip(altitudes, altitudes[1:])]
-        sd = stat.stdev(meters_per_second)
-        mn = stat.mean(meters_per_second)
-        high = mn + 2.0 * sd
-        low = mn - 2.0 * sd
-        calc_list = [float(x) for x in meters_per_second if low < x < high]
-        value = round(stat.mean(calc_list), 1)
+        if all(x.is_integer() for x in meters_per_second):  # whole meters: exact integer path
+            value = lift_sink_from_counts(Counter(map(int, meters_per_second)))
+        else:
+            sd = stat.stdev(meters_per_second)
+            mn = stat.mean(meters_per_second)
+            high = mn + 2.0 * sd
+            low = mn - 2.0 * sd
+            calc_list = [float(x) for x in meters_per_second if low < x < high]
+            value = round(stat.mean(calc_list), 1)
     except Exception as exc:
         value = 0
     finally:
         return value
 
 
+def lift_sink_from_counts(rates: Counter) -> float:
+    # calc_lift_sink() over a Counter of whole-meter altitude deltas -> same value, no per-fix lists
+    n, s1, s2 = count_moments(rates)
+    if n < 2:
+        return 0
+    mn = s1 / n
+    sd = count_stdev(n, s1, s2)
+    high = mn + 2.0 * sd
+    low = mn - 2.0 * sd
+    kept = total = 0
+    for rate, count in rates.items():
+        if low < rate < high:
+            kept += count
+            total += rate * count
+    return round(total / kept, 1) if kept else 0
+
+
+def count_moments(rates: Counter):
+    # (n, sum, sum of squares) of a Counter of integer values, all exact
+    n = s1 = s2 = 0
+    for rate, count in rates.items():
+        n += count
+        s1 += rate * count
+        s2 += rate * rate * count
+    return n, s1, s2
+
+
+def count_stdev(n, s1, s2):
+    # statistics.stdev() from exact moments: correctly rounded sqrt of (n*s2 - s1^2) / (n*(n-1))
+    num, den = n * s2 - s1 * s1, n * (n - 1)
+    if num <= 0:
+        return 0.0
+    q = (num.bit_length() - den.bit_length() - 109) // 2
+    if q >= 0:
+        root = _isqrt_frac_rto(num, den << 2 * q) << q
+        return float(root)
+    return _isqrt_frac_rto(num << -2 * q, den) / (1 << -q)
+
+
+def _isqrt_frac_rto(n, m):
+    # square root of n/m, rounded to odd (keeps the final float rounding correct)
+    a = isqrt(n // m)
+    return a | (a * a * m != n)
+
+
+def global_climb_from_counts(rates: Counter) -> float:
+    # mean climb rate within 2 sigma (inclusive) of all climb readings, else the plain mean
+    n, s1, s2 = count_moments(rates)
+    if n == 0:
+        return 0.0
+    mn = s1 / n
+    if n < 2:
+        return mn
+    sd = count_stdev(n, s1, s2)
+    kept = total = 0
+    for rate, count in rates.items():
+        if mn - 2 * sd <= rate <= mn + 2 * sd:
+            kept += count
+            total += rate * count
+    return total / kept if kept else mn
+
+
 def calculate_climb_efficiency(altis, global_avg_climb, averaging_factor):
     if len(altis) < 2:
         return 0.0
+    rates = Counter(int(t - s) for s, t in zip(altis, altis[1:]))
+    return climb_efficiency_from_counts(rates, altis[-1] - altis[0], global_avg_climb)
+
 
-    climb_rates = [float(t - s) for s, t in zip(altis, altis[1:])]
+def climb_efficiency_from_counts(rates: Counter, net_gain, global_avg_climb):
+    # rates: Counter of the block's whole-meter climb rates; net_gain: last - first altitude
+    n, s1, s2 = count_moments(rates)
+    if n < 1:
+        return 0.0
 
-    net_gain = altis[-1] - altis[0]
-    expected_gain = len(climb_rates) * global_avg_climb if global_avg_climb > 0 else 1
+    expected_gain = n * global_avg_climb if global_avg_climb > 0 else 1
 
     net_efficiency = min(net_gain / expected_gain, 1.0) if expected_gain > 0 else 0.0
 
-    try:
-        rate_sd = stat.stdev(climb_rates)
+    if n >= 2:
+        rate_sd = count_stdev(n, s1, s2)
         consistency_score = max(0, 1 - (rate_sd / (global_avg_climb * 2))) if global_avg_climb > 0 else 0.5
-    except:
+    else:
         consistency_score = 0.5
 
     threshold = global_avg_climb * 0.5
-    sustained_count = sum(1 for r in climb_rates if r >= threshold)
-    sustained_ratio = sustained_count / len(climb_rates) if climb_rates else 0
+    sustained_count = sum(count for r, count in rates.items() if r >= threshold)
+    sustained_ratio = sustained_count / n
 
-    positive_steps = sum(1 for r in climb_rates if r > 0)
-    positive_ratio = positive_steps / len(climb_rates) if climb_rates else 0
+    positive_steps = sum(count for r, count in rates.items() if r > 0)
+    positive_ratio = positive_steps / n
 
     efficiency = (
             net_efficiency * 0.35 +
@@ -61,18 +141,31 @@ def calculate_climb_efficiency(altis, global_avg_climb, averaging_factor):
 
 
 # Detection & specific analysis mechanisms  --------------------------------------------------------------------|
-def detect_circling(blocks, min_turns=2, min_duration=20, min_alt_gain=50, max_drift_m=1000):
-    circling_blocks = []
-    for block in blocks:
-        if block['tyype'] == 'Climb' and block['time_secs'] >= min_duration:
-            alt_gain = block['altitude_end_m'] - block['altitude_start_m']
-            if alt_gain >= min_alt_gain:
-                start_loc = block['loc_start']
-                end_loc = block['loc_end']
-                distance = haversine(start_loc, end_loc) * 1000
-                if distance < max_drift_m:
-                    circling_blocks.append(block)
-    return circling_blocks
+def annotate_blocks(blocks, turnpoints=True, min_duration=20, min_alt_gain=50, max_drift_m=1000):
+    # one detection pass over the details: drift_m (start-end distance) & the circling flag on every
+    # block, plus the turnpoint flag (a climb between two glides within 0.5 m/s of the strongest climb);
+    # the thermal report, flight type & kml markers all read these flags
+    drift = haversine_many([b['loc_start'][0] for b in blocks], [b['loc_start'][1] for b in blocks],
+                           [b['loc_end'][0] for b in blocks], [b['loc_end'][1] for b in blocks])
+    for block, distance in zip(blocks, drift):
+        block['drift_m'] = round(distance * 1000)
+        block['circling'] = (block['tyype'] == 'Climb' and block['time_secs'] >= min_duration
+                             and block['altitude_end_m'] - block['altitude_start_m'] >= min_alt_gain
+                             and distance * 1000 < max_drift_m)
+    if turnpoints:
+        strongest = max((b['avg_lift_sink_ms'] for b in blocks if b['tyype'] == 'Climb'), default=None)
+        for i, block in enumerate(blocks):
+            block['turnpoint'] = (0 < i < len(blocks) - 1 and block['tyype'] == 'Climb'
+                                  and blocks[i - 1]['tyype'] == 'Glide' and blocks[i + 1]['tyype'] == 'Glide'
+                                  and abs(block['avg_lift_sink_ms'] - strongest) < 0.5)
+    return blocks
+
+
+def detect_circling(blocks):
+    # circling (thermal) blocks, annotating blocks that have not been through annotate_blocks() yet
+    if any('circling' not in b for b in blocks):
+        annotate_blocks(blocks, turnpoints=False)
+    return [b for b in blocks if b['circling']]
 
 
 def calculate_thermal_stats(thermal_blocks, all_blocks):
@@ -206,23 +299,106 @@ def analyze_glide_performance(blocks, glider_type=None):
 
 
 # Core Functions ---------------------------------------------------------------------------|
-def load_igc(in_igc_file):
+def parse_header_line(line, header):
+    # H-Records: pilot, vario, glider & flight date
+    if line[:5] == "HFPLT":  # xc tracer pilot data
+        offset = 11
+        if line[:19] == "HFPLTPILOTINCHARGE:":  # flymaster pilot data
+            offset = 19
+        header["pilot"] = line[offset:].replace("\n", "")
+
+    if line[:12] == "HFFTYFRTYPE:":
+        header["vario"] = line[12:].replace("\n", "").replace(",", " ")
+
+    if line.startswith("HFGPS:"):
+        header["vario"] += f", {line[6:]}".replace("\n", "")
+
+    if line.startswith("HFGTYGLIDERTYPE:"):
+        header["glider"] = line[16:].replace("\n", "")
+
+    if line.startswith("HFDTEDATE:"):  # SeeYou Navigator
+        header["raw_utc_date"] = line[10:].replace("\n", "").split(",")[0]
+    elif line.startswith("HFDTE"):  # date info
+        header["raw_utc_date"] = line[5:].replace("\n", "")
+    return header
+
+
+def iter_b_records(source, flight):
     # File Parse Data
     # 0 123456 78901234 567890123 4 56789 01234 5678901234567890
     # R TTTTTT DDMMSSSC DDDMMSSSC V PPPPP GGGGG AAA SS NNN CRLF
     # B 050818 2801340N 08344054E A 01638 01639 001 10 002 3130139
-    global alt_m
-    f = open(in_igc_file, "r")
-    lines = f.readlines()
+    # source: path or any file-like object (text or bytes); H-Records are parsed into flight as they pass
+    for raw_utc_date, line in iter_b_lines(source, flight):
+        yield parse_b_record(line, raw_utc_date)
+
+
+def iter_b_lines(source, flight):
+    # (raw_utc_date, B-Record line) without decoding the fixes; H-Records are parsed into flight.
+    # source: path, IGC file content as bytes, or any iterable / file-like object of lines
+    if isinstance(source, (str, PathLike)):
+        with open(source, "r") as f:
+            yield from iter_b_lines(f, flight)
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    flight.setdefault("pilot", "")
+    flight.setdefault("vario", "")
+    flight.setdefault("glider", "")
+    flight.setdefault("raw_utc_date", None)
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode("latin-1")
+        if not line:
+            continue
+        if line[0] == "H":
+            parse_header_line(line, flight)
+
+        elif line[0] == "B":  # data lines start with 'B'
+            yield flight["raw_utc_date"], line
+
+
+def parse_b_record(line, raw_utc_date):
+    # one B-Record line -> (raw_utc_date, raw_time, lat, lon, alt_m)
+    raw_time = line[1:7]
+
+    lat_raw = line[7:14]
+    lat = int(lat_raw[:2]) + float(lat_raw[2:]) / 60000
+    ns = line[14]
+    if ns == "S":
+        lat = lat * -1
 
-    pilot: str = ""
-    vario: str = ""
-    glider: str = ""
+    lon_raw = line[15:23]
+    lon = int(lon_raw[:3]) + float(lon_raw[3:]) / 60000
+    ew = line[23]
+    if ew == "W":
+        lon = lon * -1
+
+    # altitude
+    alt_m = int(line[25:30])  # pressure altitude
+    if alt_m == 0:
+        alt_m = int(line[30:35])  # gps altitude
+
+    return raw_utc_date, raw_time, lat, lon, alt_m
+
+
+def iter_fixes(b_records, flight):
+    # Running statistics over B-Records: yields analysis tuples (datetime, lat, lon, alt_m, heading, distance)
+    # and stores takeoff/landing/max values in flight once the records are exhausted
+    step = fix_stepper(flight)
+    next(step)
+    for record in b_records:
+        yield step.send(record)
+    step.send(None)
+
+
+def fix_stepper(flight):
+    # Coroutine behind iter_fixes(): send() a B-Record (raw_utc_date, raw_time, lat, lon, alt_m) and get
+    # its analysis tuple back; send(None) stores the takeoff/landing/max values so far in flight
     raw_utc_date = None
-    takeoff_dt: None
-    landing_dt: None
-    duration: int = 0
     raw_time = 0
+    takeoff_dt = None
     takeoff_lat: float = 0.00
     takeoff_lon: float = 0.00
     takeoff_alt_m: float = 0.00  # meters
@@ -236,326 +412,379 @@ def load_igc(in_igc_file):
     high_sink_m: float = 0.00
     last_lat: float = 0.00
     last_lon: float = 0.00
-    last_alt: int = 0
-    landing_alt_m: float = 0.00
-    landing_heading: int = 0
+    last_alt_m: int = 0
     total_distance_km = 0.00
-    lon_lat_alt_list = []
     flight_area_km = 0.00
-
     takeoff_flag = True
-    analysis_data = []
-    climb_readings = 0
-    glide_readings = 0
-
-    model_data = {}
-
-    for i, line in enumerate(lines):
-        if line[:5] == "HFPLT":  # xc tracer pilot data
-            offset = 11
-            if line[:19] == "HFPLTPILOTINCHARGE:":  # flymaster pilot data
-                offset = 19
-            pilot = line[offset:].replace("\n", "")
-
-        if line[:12] == "HFFTYFRTYPE:":
-            vario = line[12:].replace("\n", "").replace(",", " ")
-
-        if line.startswith("HFGPS:"):
-            vario += f", {line[6:]}".replace("\n", "")
-
-        if line.startswith("HFGTYGLIDERTYPE:"):
-            glider = line[16:].replace("\n", "")
-
-        if line.startswith("HFDTEDATE:"):  # SeeYou Navigator
-            raw_utc_date = line[10:].replace("\n", "").split(",")[0]
-        elif line.startswith("HFDTE"):  # date info
-            raw_utc_date = line[5:].replace("\n", "")
-
-        elif line[0] == "B":  # data lines start with 'B'
-            raw_time = line[1:7]
-
-            lat_raw = line[7:14]
-            lat = int(lat_raw[:2]) + float(lat_raw[2:]) / 60000
-            ns = line[14]
-            if ns == "S":
-                lat = lat * -1
-
-            lon_raw = line[15:23]
-            lon = int(lon_raw[:3]) + float(lon_raw[3:]) / 60000
-            ew = line[23]
-            if ew == "W":
-                lon = lon * -1
-
-            # total distance
-            travelled = haversine((last_lat, last_lon), (lat, lon))
-            # print(f"GPS: ({last_lat}, {last_lon}), ({lat}, {lon})\tTravelled: {travelled}")
-            if i == 0:
-                travelled = 0
-            elif travelled < .3:
-                total_distance_km += travelled
-            elif travelled > 25:
-                travelled = 0
-
-            # get bearing
-            if last_lat != 0.00 and last_lon != 0.00 and \
-                    (last_lat, last_lon) != (lat, lon):
-                heading = bearing((last_lat, last_lon), (lat, lon))
-                # print(f"GPS: {(last_lat, last_lon), (lat, lon)}\tHeading {heading}")
-
-                if takeoff_flag:  # set takeoff data
-                    takeoff_dt = convert_hm_to_dt(raw_utc_date, raw_time)
-                    takeoff_lat = lat
-                    takeoff_lon = lon
-                    takeoff_alt_m = alt_m
-                    takeoff_heading = heading
-                    takeoff_flag = False
-
-            # set last lat, lon
-            last_lat = lat
-            last_lon = lon
-
-            # altitude, lift & sink
-            alt_m = int(line[25:30])  # pressure altitude
-            if alt_m == 0:
-                alt_m = int(line[30:35])  # gps altitude
-            landing_alt_m = alt_m
-
-            # flight area calculation (only after takeoff is established, skip zero coords)
-            if not takeoff_flag and lat != 0.0 and lon != 0.0:
-                fa_dist = haversine((takeoff_lat, takeoff_lon), (lat, lon))
-                if fa_dist > flight_area_km:
-                    flight_area_km = fa_dist
-
-            # List for kml path
-            lon_lat_alt_list.append((lon, lat, alt_m))
-
-            # Climb & Sink with averaging
-            if int(raw_time[-2:]) % settings["averaging_factor"] == 0:
-                if len(alt_readings) >= settings["averaging_factor"]:
-                    climb_sink = calc_lift_sink(alt_readings)
-                    if climb_sink > high_lift_m:
-                        high_lift_m = climb_sink
-                    elif climb_sink < high_sink_m:
-                        high_sink_m = climb_sink
-                    alt_readings = []
-            else:
-                alt_readings.append(float(alt_m))
-
-            # Analysis - Climbs & Glides
-            a_data = (int(f"{raw_utc_date}{raw_time}"), lat, lon, alt_m, heading, travelled)
-            analysis_data.append(a_data)
-
-            # Count climbs and glides
-            if alt_m > last_alt:
-                climb_readings += 1
-            elif alt_m <= last_alt:
-                glide_readings += 1
-
-            # set values
-            if alt_m > high_alt_m:
-                high_alt_m = alt_m
-            last_alt = alt_m
-
-    # Final calcs & vars
-    takeoff_to_land_dist = haversine((takeoff_lat, takeoff_lon), (last_lat, last_lon))
-    takeoff_gps = (round(takeoff_lat, 5), round(takeoff_lon, 5))
-    landing_gps = (round(last_lat, 5), round(last_lon, 5))
-
-    # Landing Determination
-    landing_dt = convert_hm_to_dt(raw_utc_date, raw_time)
-    landing_heading = heading
-    duration = (landing_dt - takeoff_dt).total_seconds()
-    if duration < 0:
-        duration = duration + (24 * 60 * 60)
-
-    # ANALYSIS SECTION
-    analysis = flight_analyzer(analysis_data, flight_area_km)
-    glide_perf = analyze_glide_performance(analysis['details'], glider)
-    thermals = None
-    if analysis['flight_type'] != 'soaring':
-        thermals = analyze_thermals(analysis['details'])
-
-    # Weather Model Data
-    model_data["takeoff_datetime"] = takeoff_dt
-    model_data["landing_datetime"] = landing_dt
-    model_data["duration"] = duration
-    model_data["takeoff_gps"] = (takeoff_lat, takeoff_lon)
-    model_data["landing_gps"] = (last_lat, last_lon)
-    model_data["max_altitude"] = high_alt_m
-    model_data["distance_total"] = total_distance_km
-    model_data["takeoff_to_landing"] = takeoff_to_land_dist
-    model_data["flight_area"] = flight_area_km
-
-    # kml File Data
-    kml_data = {"pilot": pilot,
-                "filename": in_igc_file,
-                "takeoff_gps": takeoff_gps,
-                "landing_gps": landing_gps,
-                "lon_lat_alt_list": lon_lat_alt_list,
-                "details": analysis['details']}
-
-    return {"filename": in_igc_file,
-            "pilot": pilot,
-            "vario": vario,
-            "glider": glider,
-            "flight_date": takeoff_dt,
-            "max_alt": high_alt_m,
-            "max_lift": high_lift_m,
-            "max_sink": high_sink_m,
-            "takeoff_datetime": format_timestamp(takeoff_dt),
-            "takeoff_alt": takeoff_alt_m,
-            "takeoff_gps": takeoff_gps,
-            "takeoff_heading": takeoff_heading,
-            "landing_datetime": format_timestamp(landing_dt),
-            "landing_alt": landing_alt_m,
-            "landing_gps": landing_gps,
-            "landing_heading": landing_heading,
-            "total_distance": round(total_distance_km, 1),
-            "takeoff_to_land_dist": round(takeoff_to_land_dist, 1),
-            "flight_area_diameter": round(flight_area_km, 2),
-            "duration": duration,
-            # Analysis Data
-            "flight_type": analysis["flight_type"],
-            "climbs_num": analysis["climbs_num"],
-            "glides_num": analysis["glides_num"],
-            "sinks_num": analysis["sinks_num"],
-            "climb_grade": analysis["climb_grade"],
-            "max_sustained_climb": analysis["max_sustained_climb"],
-            "glide_grade": analysis["glide_grade"],
-            "sink_grade": analysis["sink_grade"],
-            "details": analysis["details"],
-            "µ_sustained_climb": analysis["µ_sustained_climb"],
-            "µ_sustained_glide": analysis["µ_sustained_glide"],
-            "model_data": model_data,
-            "lon_lat_alt_list": lon_lat_alt_list,
-            # Glide, Thermal & kml Data
-            "glide_perf": glide_perf,
-            "thermals": thermals,
-            "kml_data": kml_data}
-
-
-def flight_analyzer(analysis_data, flight_area_km=0.0):
+    first_fix = True
+    fix = None
+
+    while True:
+        record = yield fix
+        if record is None:
+            flight.update({"takeoff_dt": takeoff_dt,
+                           "landing_dt": convert_hm_to_dt(raw_utc_date, raw_time) if not first_fix else None,
+                           "takeoff_lat": takeoff_lat,
+                           "takeoff_lon": takeoff_lon,
+                           "takeoff_alt_m": takeoff_alt_m,
+                           "takeoff_heading": takeoff_heading,
+                           "landing_lat": last_lat,
+                           "landing_lon": last_lon,
+                           "landing_alt_m": last_alt_m,
+                           "landing_heading": heading,
+                           "high_alt_m": high_alt_m,
+                           "high_lift_m": high_lift_m,
+                           "high_sink_m": high_sink_m,
+                           "total_distance_km": total_distance_km,
+                           "flight_area_km": flight_area_km})
+            fix = None
+            continue
+
+        raw_utc_date, raw_time, lat, lon, alt_m = record
+
+        # total distance
+        travelled = haversine((last_lat, last_lon), (lat, lon))
+        if first_fix:
+            travelled = 0
+            first_fix = False
+        elif travelled < .3:
+            total_distance_km += travelled
+        elif travelled > 25:
+            travelled = 0
+
+        # get bearing
+        if last_lat != 0.00 and last_lon != 0.00 and \
+                (last_lat, last_lon) != (lat, lon):
+            heading = bearing((last_lat, last_lon), (lat, lon))
+
+            if takeoff_flag:  # set takeoff data
+                takeoff_dt = convert_hm_to_dt(raw_utc_date, raw_time)
+                takeoff_lat = lat
+                takeoff_lon = lon
+                takeoff_alt_m = last_alt_m
+                takeoff_heading = heading
+                takeoff_flag = False
+
+        # set last lat, lon
+        last_lat = lat
+        last_lon = lon
+
+        # flight area calculation (only after takeoff is established, skip zero coords)
+        if not takeoff_flag and lat != 0.0 and lon != 0.0:
+            fa_dist = haversine((takeoff_lat, takeoff_lon), (lat, lon))
+            if fa_dist > flight_area_km:
+                flight_area_km = fa_dist
+
+        # Climb & Sink with averaging
+        if int(raw_time[-2:]) % settings["averaging_factor"] == 0:
+            if len(alt_readings) >= settings["averaging_factor"]:
+                climb_sink = calc_lift_sink(alt_readings)
+                if climb_sink > high_lift_m:
+                    high_lift_m = climb_sink
+                elif climb_sink < high_sink_m:
+                    high_sink_m = climb_sink
+                alt_readings = []
+        else:
+            alt_readings.append(float(alt_m))
+
+        # set values
+        if alt_m > high_alt_m:
+            high_alt_m = alt_m
+        last_alt_m = alt_m
+
+        # Analysis - Climbs & Glides
+        fix = int(f"{raw_utc_date}{raw_time}"), lat, lon, alt_m, heading, travelled
+
+
+def parse_igc(in_igc_file):
+    flight = {}
+    track = FlightTrack.from_fixes(iter_fixes(iter_b_records(in_igc_file, flight), flight))
+    return flight, track
+
+
+def scan_flight(source):
+    # header & takeoff/landing fields of parse_igc() without its per-fix statistics: B-Records are
+    # only decoded up to takeoff & back from the end to the last movement
+    flight = {}
+    b_lines = list(iter_b_lines(source, flight))
+
+    def moved(last, record):
+        return last[2] != 0.00 and last[3] != 0.00 and (last[2], last[3]) != (record[2], record[3])
+
+    takeoff = None
+    last = None
+    for i, (raw_utc_date, line) in enumerate(b_lines):
+        record = parse_b_record(line, raw_utc_date)
+        if last is not None and moved(last, record):
+            takeoff = i, last, record
+            break
+        last = record
+
+    landing_heading = 0.00
+    if takeoff is not None:
+        record = parse_b_record(b_lines[-1][1], b_lines[-1][0])
+        for i in range(len(b_lines) - 1, takeoff[0] - 1, -1):
+            last = parse_b_record(b_lines[i - 1][1], b_lines[i - 1][0])
+            if moved(last, record):
+                landing_heading = bearing((last[2], last[3]), (record[2], record[3]))
+                break
+            record = last
+
+    landing = parse_b_record(b_lines[-1][1], b_lines[-1][0]) if b_lines else (None, 0, 0.00, 0.00, 0)
+    _, last, record = takeoff if takeoff is not None else (None, None, None)
+    flight.update({"takeoff_dt": convert_hm_to_dt(record[0], record[1]) if takeoff else None,
+                   "landing_dt": convert_hm_to_dt(landing[0], landing[1]) if b_lines else None,
+                   "takeoff_lat": record[2] if takeoff else 0.00,
+                   "takeoff_lon": record[3] if takeoff else 0.00,
+                   "takeoff_alt_m": last[4] if takeoff else 0.00,
+                   "takeoff_heading": bearing((last[2], last[3]), (record[2], record[3])) if takeoff else 0,
+                   "landing_lat": landing[2],
+                   "landing_lon": landing[3],
+                   "landing_alt_m": landing[4],
+                   "landing_heading": landing_heading,
+                   "fixes": len(b_lines)})
+    return flight
+
+
+def read_source(source):
+    # file-like objects are read once into bytes (or lines, for text streams) so the scan & the
+    # later full parse can both go over the content; paths & bytes are returned as they are
+    if not hasattr(source, "read"):
+        return source
+    content = source.read()
+    return content.splitlines(True) if isinstance(content, str) else content
+
+
+def source_name(source, name=None):
+    # the 'filename' of the results: name if given, else the path (or the file object's name)
+    if name is not None:
+        return name
+    if isinstance(source, (str, PathLike)):
+        return source
+    return getattr(source, "name", "flight.igc")
+
+
+def compile_results(in_igc_file, flight, analysis, track, timings=None, name=None):
+    # results over already parsed & analyzed parts (derived sections are still built on first access)
+    from result import FlightResult
+    return FlightResult(in_igc_file, flight=flight, track=track, analysis=analysis, timings=timings, name=name)
+
+
+def load_igc(in_igc_file, name=None):
+    # Lazy results: the file is parsed & analyzed only when a key needs it (see result.FlightResult);
+    # with timing enabled they carry a 'timings' section (per stage wall/cpu time & allocations).
+    # in_igc_file: path, IGC content as bytes, or a file-like object; name sets the 'filename' of
+    # in-memory sources (used for the kml/kmz names)
+    from result import FlightResult
+    return FlightResult(in_igc_file, name=name)
+
+
+def stream_igc(source, keep_track=False):
+    # Constant-memory load_igc(): B-Records are parsed, summarized & segmented as they are read.
+    # source: path or file-like object with time-ordered B-Records; the per-fix FlightTrack
+    # (needed for kml output) is only collected when keep_track is set
+    flight = {}
+    track = FlightTrack()
+    fixes = iter_fixes(iter_b_records(source, flight), flight)
+    if keep_track:
+        fixes = _collect_track(fixes, track)
+    analysis = grade_blocks(list(iter_blocks(fixes)), flight["flight_area_km"])
+    in_igc_file = source if isinstance(source, (str, PathLike)) else getattr(source, "name", "flight.igc")
+    return compile_results(str(in_igc_file), flight, analysis, track)
+
+
+def _collect_track(fixes, track):
+    for fix in fixes:
+        track.append(fix)
+        yield fix
+
+
+def iter_blocks(analysis_data):
     # from settings
     # "averaging_factor": 10,
     # "climb_ascend_threshold": 0.5,
     # "sink_descend_threshold": 2.5,
-    analysis_data.sort(key=lambda row: row[0])
-    chunks = []
-    chunk_cat = []
-    blocks = []  # (datetime, lat, lon, alt_m, heading, distance, climb_sink, category)
-    blocks_cat = []
+    # Streams contiguous Climb/Glide/Sink blocks out of time-ordered analysis tuples
+    # (datetime, lat, lon, alt_m, heading, distance); blocks keep a Counter of their climb rates
+    # instead of per-fix altitudes, start/stop are the block's fix indices
+    segmenter = new_segmenter()
+    for line in analysis_data:
+        block = segment_fix(segmenter, line)
+        if block is not None:
+            yield block
+
+    # the trailing (incomplete) chunk is not classified
+    if segmenter["block"] is not None:
+        yield _close_block(segmenter["block"])
+
+
+def new_segmenter():
+    # push-style state behind iter_blocks(): analysis tuples go in one at a time through segment_fix()
+    return {"index": 0, "chunk": [], "block": None}
+
+
+def segment_fix(segmenter, line):
+    # adds one analysis tuple, returns the block it closed (or None)
+    factor = settings["averaging_factor"]
+    i = segmenter["index"]
+    segmenter["index"] = i + 1
+    chunk = segmenter["chunk"]
+    block = segmenter["block"]
+    closed = None
 
     # Step 1: Chunk into 'averaging_factor' Chunks
-    temp = []
-    for i, line in enumerate(analysis_data):
-        # (datetime, lat, lon, alt_m, heading, distance)
-        if i > 0 and i % settings["averaging_factor"] == 0:
-            chunks.append(temp)
-            temp = []
-        temp.append(line)
-
-    # Step 2: Analyze for Climb, GLide or Sink
-    for chunk in chunks:
-        altitudes = [x[3] for x in chunk]
-        avg_ls = calc_lift_sink(altitudes)
-
-        # Determine Category: Climb, Glide, Sink
-        if avg_ls > settings["climb_ascend_threshold"]:
-            chunk_cat.append("C")  # ("C", alt_diff, avg_ls, distance_diff))
-        elif avg_ls < (settings["sink_descend_threshold"] * -1):
-            chunk_cat.append("S")  # ("S", alt_diff, avg_ls, distance_diff))
-        else:
-            chunk_cat.append("G")  # ("G", alt_diff, avg_ls, distance_diff))
-
-    # Step 3: Consolidate contiguous types
-    # chunks[i]: (datetime, lat, lon, alt_m, heading, distance)
-    # chunk_cat[i]: (category, avg_ls)
-    if not chunks:
-        chunks = []
-    temp = chunks[0] if chunks else []
-    for i in range(1, len(chunk_cat)):
-        if chunk_cat[i] == chunk_cat[i - 1]:
-            temp = temp + chunks[i]
+    if i > 0 and i % factor == 0:
+        # Step 2: Analyze for Climb, GLide or Sink
+        chunk_rates = Counter(t[3] - s[3] for s, t in zip(chunk, chunk[1:]))
+        cat = classify_lift_sink(lift_sink_from_counts(chunk_rates))
+
+        # Step 3: Consolidate contiguous types
+        if block is not None and block["cat"] != cat:
+            closed = _close_block(block)
+            block = None
+        if block is None:
+            block = {"cat": cat, "rates": Counter(), "start": i - len(chunk), "stop": i,
+                     "first": chunk[0], "last": None, "distance": 0}
+            segmenter["block"] = block
         else:
-            # temp.sort(key=lambda x: x[0])
-            blocks.append(temp)
-            avg_ls = calc_lift_sink([x[3] for x in temp])
-            blocks_cat.append((chunk_cat[i - 1], avg_ls))
-            temp = chunks[i]
-
-    if temp:
-        blocks.append(temp)
-        avg_ls = calc_lift_sink([x[3] for x in temp])
-        blocks_cat.append((chunk_cat[-1], avg_ls))
-
+            chunk_rates[chunk[0][3] - block["last"][3]] += 1  # step across the chunk boundary
+        block["rates"].update(chunk_rates)
+        for x in chunk:
+            block["distance"] += x[5]
+        block["last"] = chunk[-1]
+        block["stop"] = i
+        chunk = segmenter["chunk"] = []
+    chunk.append(line)
+    return closed
+
+
+def open_block(segmenter):
+    # the block in progress, closed as it would be if the data ended here (or None)
+    block = segmenter["block"]
+    if block is None:
+        return None
+    return _close_block(dict(block, rates=Counter(block["rates"])))
+
+
+def iter_track_blocks(track):
+    # iter_blocks() over a time-ordered FlightTrack using fix index ranges: the climb rate of every
+    # step is computed once and each chunk & block is summarized from it, linear in the fixes
+    factor = settings["averaging_factor"]
+    alt = track.column("alt")
+    steps = array("i", map(sub, alt[1:], alt))
+    block = None
+
+    # the trailing (incomplete) chunk is not classified
+    for start in range(0, len(track) - factor, factor):
+        cat = classify_lift_sink(lift_sink_from_counts(Counter(steps[start:start + factor - 1])))
+        if block is not None and block["cat"] == cat:
+            block["stop"] = start + factor
+            continue
+        if block is not None:
+            yield _close_track_block(block, track, steps)
+        block = {"cat": cat, "start": start, "stop": start + factor}
+
+    if block is not None:
+        yield _close_track_block(block, track, steps)
+
+
+def classify_lift_sink(avg_ls):
+    if avg_ls > settings["climb_ascend_threshold"]:
+        return "C"
+    if avg_ls < (settings["sink_descend_threshold"] * -1):
+        return "S"
+    return "G"
+
+
+def _close_track_block(block, track, steps):
+    start, stop = block["start"], block["stop"]
+    distance = 0
+    for d in track.distance[start:stop]:  # summed in fix order, as iter_blocks() does
+        distance += d
+    block.update({"rates": Counter(steps[start:stop - 1]), "first": track[start], "last": track[stop - 1],
+                  "distance": distance})
+    return _close_block(block)
+
+
+def _close_block(block):
+    block["count"] = block["stop"] - block["start"]
+    block["avg_ls"] = lift_sink_from_counts(block["rates"])
+    if block["cat"] != "C":  # only climbs need their rates for grading
+        block["rates"] = None
+    return block
+
+
+def flight_analyzer(track, flight_area_km=0.0):
+    # track: FlightTrack (or a list of analysis tuples)
+    if not isinstance(track, FlightTrack):
+        track = FlightTrack.from_fixes(track)
+    if not track.is_time_ordered():
+        track = track.sorted_by_time()
+    with stage("segment"):
+        blocks = list(iter_track_blocks(track))
+    with stage("grade"):
+        return grade_blocks(blocks, flight_area_km)
+
+
+def block_detail(number, block):
+    first, last = block["first"], block["last"]
+    detail = {}
+    detail["number"] = number
+    detail["tyype"] = TYYPE_LOOKUP[block["cat"]]
+    detail["time_secs"] = block["count"]
+    detail["altitude_start_m"] = first[3]
+    detail["altitude_end_m"] = last[3]
+    detail["avg_lift_sink_ms"] = block["avg_ls"]
+    if block["cat"] == "G":
+        lift = abs(last[3] - first[3])
+        if lift == 0:
+            lift = 1
+        distance = round(block["distance"] * 1000)
+        l_over_d = round(distance / lift, 2)
+        detail["l_over_d"] = l_over_d if l_over_d <= MAX_GLIDE_RATIO else 0
+    detail["loc_start"] = (first[1], first[2])
+    detail["loc_end"] = (last[1], last[2])
+    detail["fix_start"] = block["start"]  # track index of the first & last fix
+    detail["fix_end"] = block["stop"] - 1
+    detail["total_distance_m"] = round(block["distance"] * 1000)
+    return detail
+
+
+def grade_blocks(blocks, flight_area_km=0.0):
+    # blocks: from iter_blocks() / iter_track_blocks() -> {cat, rates (Climb only), count, start, stop,
+    # first, last, distance, avg_ls}
     # Step 4: Analysis
     climbing_grades = []
     gliding_grades = []
     sinking_grades = []
-    all_climb_rates = []
-
-    for i, block in enumerate(blocks):
-        if block != []:
-            tyype = blocks_cat[i][0]
-            altis = [x[3] for x in block]
-            if tyype == "C":
-                climb_rates = [float(t - s) for s, t in zip(altis, altis[1:])]
-                all_climb_rates.extend(climb_rates)
-
-    global_avg_climb = 0.0
-    if all_climb_rates:
-        try:
-            sd_all = stat.stdev(all_climb_rates)
-            mn_all = stat.mean(all_climb_rates)
-            filtered_rates = [r for r in all_climb_rates if mn_all - 2 * sd_all <= r <= mn_all + 2 * sd_all]
-            global_avg_climb = stat.mean(filtered_rates) if filtered_rates else stat.mean(all_climb_rates)
-        except:
-            global_avg_climb = stat.mean(all_climb_rates) if all_climb_rates else 0
-
-    for i, block in enumerate(blocks):
-        if block != []:
-            tyype = blocks_cat[i][0]
-            altis = [x[3] for x in block]
-            if tyype == "C":
-                efficiency = calculate_climb_efficiency(altis, global_avg_climb, settings["averaging_factor"])
-                climbing_grades.append(efficiency)
-            elif tyype == "G":  # glides analysis - Calc L/D & aggregate
-                lift = abs(block[-1][3] - block[0][3])
-                if lift == 0:
-                    lift = 1
-                distance = round(sum(x[5] for x in block) * 1000)
-                l_over_d = round(distance / lift, 2)
-                if l_over_d <= MAX_GLIDE_RATIO:
-                    gliding_grades.append(l_over_d)
-            elif tyype == "S":  # record abs of sink rate
-                sink_rate = abs(blocks_cat[i][1])
-                sinking_grades.append(sink_rate)
+    all_climb_rates = Counter()  # climb rate -> readings, keeps memory independent of flight length
+
+    for block in blocks:
+        if block["cat"] == "C":
+            all_climb_rates.update(block["rates"])
+
+    global_avg_climb = global_climb_from_counts(all_climb_rates)
+
+    for block in blocks:
+        tyype = block["cat"]
+        if tyype == "C":
+            efficiency = climb_efficiency_from_counts(block["rates"], block["last"][3] - block["first"][3],
+                                                      global_avg_climb)
+            climbing_grades.append(efficiency)
+        elif tyype == "G":  # glides analysis - Calc L/D & aggregate
+            lift = abs(block["last"][3] - block["first"][3])
+            if lift == 0:
+                lift = 1
+            distance = round(block["distance"] * 1000)
+            l_over_d = round(distance / lift, 2)
+            if l_over_d <= MAX_GLIDE_RATIO:
+                gliding_grades.append(l_over_d)
+        elif tyype == "S":  # record abs of sink rate
+            sink_rate = abs(block["avg_ls"])
+            sinking_grades.append(sink_rate)
 
     # Step 5: Detail Data
-    details = []
-    tyype_lookup = {"G": "Glide", "C": "Climb", "S": "Sink"}
-    for i, block in enumerate(blocks):
-        if block != []:
-            altis = [x[3] for x in block]
-            block_detail = {}
-            block_detail["number"] = i
-            block_detail["tyype"] = tyype_lookup[blocks_cat[i][0]]
-            block_detail["time_secs"] = len(block)
-            block_detail["altitude_start_m"] = block[0][3]
-            block_detail["altitude_end_m"] = block[-1][3]
-            block_detail["avg_lift_sink_ms"] = blocks_cat[i][1]
-            if blocks_cat[i][0] == "G":
-                lift = abs(block[-1][3] - block[0][3])
-                if lift == 0:
-                    lift = 1
-                distance = round(sum(x[5] for x in block) * 1000)
-                l_over_d = round(distance / lift, 2)
-                block_detail["l_over_d"] = l_over_d if l_over_d <= MAX_GLIDE_RATIO else 0
-            block_detail["loc_start"] = (block[0][1], block[0][2])
-            block_detail["loc_end"] = (block[-1][1], block[-1][2])
-            block_detail["total_distance_m"] = round(sum(x[5] for x in block) * 1000)
-
-            details.append(block_detail)
+    details = annotate_blocks([block_detail(i, block) for i, block in enumerate(blocks)])
 
     # Total Grades
     climb_grade = 0.00
@@ -570,9 +799,12 @@ def flight_analyzer(analysis_data, flight_area_km=0.0):
     if len(sinking_grades) > 0:
         sink_grade = round(stat.mean(sinking_grades), 2)
 
-    avg_sustained_climb = round(stat.mean([x['avg_lift_sink_ms'] for x in details if x["tyype"] == "Climb"]), 2)
-    max_sustained_climb = max([x['avg_lift_sink_ms'] for x in details if x["tyype"] == "Climb"])
-    avg_sustained_glide = round(stat.mean([x['avg_lift_sink_ms'] for x in details if x["tyype"] == "Glide"]), 2)
+    # 0.00 until there is a climb / glide (e.g. a flight still being fed to IncrementalAnalyzer)
+    climb_rates = [x['avg_lift_sink_ms'] for x in details if x["tyype"] == "Climb"]
+    glide_rates = [x['avg_lift_sink_ms'] for x in details if x["tyype"] == "Glide"]
+    avg_sustained_climb = round(stat.mean(climb_rates), 2) if climb_rates else 0.00
+    max_sustained_climb = max(climb_rates) if climb_rates else 0.00
+    avg_sustained_glide = round(stat.mean(glide_rates), 2) if glide_rates else 0.00
 
     circling_blocks = detect_circling(details)
     flight_type = 'soaring'  # default type
@@ -587,7 +819,6 @@ def flight_analyzer(analysis_data, flight_area_km=0.0):
         climb_time = sum(b['time_secs'] for b in details if b['tyype'] == 'Climb')
         climb_ratio = climb_time / total_time if total_time > 0 else 0
 
-        climb_rates = [b['avg_lift_sink_ms'] for b in details if b['tyype'] == 'Climb']
         avg_climb = stat.mean(climb_rates) if climb_rates else 0
 
         sink_time = sum(b['time_secs'] for b in details if b['tyype'] == 'Sink')
@@ -616,8 +847,9 @@ def flight_analyzer(analysis_data, flight_area_km=0.0):
 
 
 def analyze_file(igc_file):
-    # Load & Analyze the file
-    results = load_igc(igc_file)
+    # Load & Analyze the file (repeat files come from the parse/analysis cache)
+    from cache import load_igc_cached
+    results = load_igc_cached(igc_file)
 
     # OPTION: CLI Display
     from display import display_summary_stats
@@ -1,7 +1,10 @@
 # CLI Display Functions
 import datetime as dt
+import html
+import json
 from base import settings
 from base import convert_meters_to_feet, convert_km_to_miles, convert_ms_to_fpm, haversine
+from timing import timed
 
 # ANSI color codes
 C_CLIMB = '\033[38;5;82m'    # green
@@ -55,122 +58,182 @@ def efficiency_grade_lookup(grade_num, flight_type='thermal'):
             return "Poor. Struggling to find or stay in lift. Lots of altitude loss within\n climbs, poor centering, or very weak/active conditions."
 
 
-def _block_color(tyype):
-    if tyype == 'Climb':
-        return C_CLIMB
-    elif tyype == 'Glide':
-        return C_GLIDE
-    elif tyype == 'Sink':
-        return C_SINK
-    return C_END
+# Report Model ------------------------------------------------------------------------------|
+# A report is built once as a list of lines, each (kind, spans): kind is "heading", "text" or "blank",
+# a span is plain text or a (text, style) pair, style being one of the ANSI_STYLES / HTML_STYLES keys. render_report() turns it
+# into plain text, ANSI terminal output, an HTML email body or JSON.
+ANSI_STYLES = {"climb": C_CLIMB, "glide": C_GLIDE, "sink": C_SINK, "title": C_TITLE, "stat": C_STAT,
+               "label": C_LABEL}
+HTML_STYLES = {"climb": "color:#2e8b00", "glide": "color:#0070c0", "sink": "color:#c00000",
+               "title": "font-weight:bold", "stat": "color:#6c6c6c", "label": "color:#8a6a00"}
+HTML_PRE = "margin:0;font-family:Menlo,Consolas,monospace;font-size:13px;white-space:pre-wrap"
 
 
-def display_details(details):
+def _block_style(tyype):
+    return {'Climb': 'climb', 'Glide': 'glide', 'Sink': 'sink'}.get(tyype)
+
+
+def _grade_style(grade):
+    if grade >= 75:
+        return 'climb'
+    elif grade >= 45:
+        return 'glide'
+    return 'sink'
+
+
+def _adder(lines):
+    # add(*spans, kind="text"); add() alone is a blank line
+    def add(*spans, kind="text"):
+        lines.append((kind if spans else "blank", spans))
+    return add
+
+
+def _gap(add, count=3):
+    for _ in range(count):
+        add()
+
+
+def detail_lines(details, add):
     for detail in details:
         altitude_change = detail['altitude_end_m'] - detail['altitude_start_m']
-        bc = _block_color(detail['tyype'])
-        print(
-            f"\n Block Number: {detail['number']}   {C_TITLE}Block Type: {bc}{detail['tyype']}{C_END}   Time in Secs: {detail['time_secs']}")
-        print(
-            f"  {C_LABEL}Altitude Start:{C_END} {detail['altitude_start_m']}m | {convert_meters_to_feet(detail['altitude_start_m'])}ft   {C_LABEL}End:{C_END} {detail['altitude_end_m']}m | {convert_meters_to_feet(detail['altitude_end_m'])}ft")
-        print(
-            f"  {C_LABEL}Change in Altitude:{C_END} {altitude_change}m | {convert_meters_to_feet(altitude_change)}ft"
-            f"   {C_LABEL}µ Lift:{C_END} {detail['avg_lift_sink_ms']}m/s | {convert_ms_to_fpm(detail['avg_lift_sink_ms'])}ft/min")
-        print(f"  {C_LABEL}Location Start:{C_END} {detail['loc_start']}   {C_LABEL}End:{C_END} {detail['loc_end']}")
-        distance = round(haversine(detail['loc_start'], detail['loc_end']) * 1000)
-        print(
-            f"  {C_LABEL}Distance Start-End:{C_END} {distance}m | {convert_meters_to_feet(distance)}ft"
-            f"   {C_LABEL}Distance Total:{C_END} {detail['total_distance_m']}m | {convert_meters_to_feet(detail['total_distance_m'])}ft")
+        add()
+        add(f" Block Number: {detail['number']}   ", ("Block Type: ", "title"),
+            (detail['tyype'], _block_style(detail['tyype'])), f"   Time in Secs: {detail['time_secs']}")
+        add("  ", ("Altitude Start:", "label"),
+            f" {detail['altitude_start_m']}m | {convert_meters_to_feet(detail['altitude_start_m'])}ft   ",
+            ("End:", "label"),
+            f" {detail['altitude_end_m']}m | {convert_meters_to_feet(detail['altitude_end_m'])}ft")
+        add("  ", ("Change in Altitude:", "label"),
+            f" {altitude_change}m | {convert_meters_to_feet(altitude_change)}ft   ", ("µ Lift:", "label"),
+            f" {detail['avg_lift_sink_ms']}m/s | {convert_ms_to_fpm(detail['avg_lift_sink_ms'])}ft/min")
+        add("  ", ("Location Start:", "label"), f" {detail['loc_start']}   ", ("End:", "label"),
+            f" {detail['loc_end']}")
+        distance = detail['drift_m'] if 'drift_m' in detail else round(haversine(detail['loc_start'], detail['loc_end']) * 1000)
+        add("  ", ("Distance Start-End:", "label"), f" {distance}m | {convert_meters_to_feet(distance)}ft   ",
+            ("Distance Total:", "label"),
+            f" {detail['total_distance_m']}m | {convert_meters_to_feet(detail['total_distance_m'])}ft")
 
 
-def display_glide_analysis(s):
-    print(f"{C_TITLE}GLIDE PERFORMANCE ANALYSIS:{C_END}")
+def glide_lines(s, add):
+    add(("GLIDE PERFORMANCE ANALYSIS:", "title"), kind="heading")
     stats = s["glide_perf"]
-    print(f"  Segments Analyzed: {stats['glide_count']}")
+    add(f"  Segments Analyzed: {stats['glide_count']}")
     if stats['glide_count'] == 0:
-        print("  No glide segments found for analysis")
-        print("\n  return to continue")
-        input()
+        add("  No glide segments found for analysis")
         return
 
-    print(f"\n  BEST GLIDE:")
-    print(f"    Glide Ratio: {stats['best_glide_ratio']}:1")
-    print(f"    Altitude: {stats['best_glide_alt']} m || {convert_meters_to_feet(stats['best_glide_alt'])} ft")
-    print(f"    Sink Rate: {stats['best_glide_sink']} m/s")
+    add()
+    add("  BEST GLIDE:")
+    add(f"    Glide Ratio: {stats['best_glide_ratio']}:1")
+    add(f"    Altitude: {stats['best_glide_alt']} m || {convert_meters_to_feet(stats['best_glide_alt'])} ft")
+    add(f"    Sink Rate: {stats['best_glide_sink']} m/s")
 
-    print(f"\n  AVERAGE GLIDE:")
-    print(f"    Glide Ratio: {stats['avg_glide_ratio']}:1")
-    print(
-        f"    Average Altitude: {stats['avg_glide_ratio_alt']} m || {convert_meters_to_feet(stats['avg_glide_ratio_alt'])} ft")
-    print(f"    Average Sink Rate: {stats['avg_sink_rate']} m/s || {convert_ms_to_fpm(stats['avg_sink_rate'])} fpm")
-    print(f"    Overall Glide Ratio: {stats['overall_glide_ratio']}:1")
+    add()
+    add("  AVERAGE GLIDE:")
+    add(f"    Glide Ratio: {stats['avg_glide_ratio']}:1")
+    add(f"    Average Altitude: {stats['avg_glide_ratio_alt']} m || {convert_meters_to_feet(stats['avg_glide_ratio_alt'])} ft")
+    add(f"    Average Sink Rate: {stats['avg_sink_rate']} m/s || {convert_ms_to_fpm(stats['avg_sink_rate'])} fpm")
+    add(f"    Overall Glide Ratio: {stats['overall_glide_ratio']}:1")
 
-    print(f"\n  SPEED-TO-FLY (MacReady):")
-    print(f"    Optimal MacReady Setting: {stats['macready_optimal']} m/s || {convert_ms_to_fpm(stats['macready_optimal'])} fpm")
+    add()
+    add("  SPEED-TO-FLY (MacReady):")
+    add(f"    Optimal MacReady Setting: {stats['macready_optimal']} m/s || {convert_ms_to_fpm(stats['macready_optimal'])} fpm")
 
     if s['duration'] > 3600:
         hours = s['duration'] / 3600
         avg_kph = round(s['total_distance'] / hours, 1)
         avg_mph = round(convert_km_to_miles(avg_kph), 1)
-        print(f"    Average Speed: {avg_kph} km/h || {avg_mph} mph")
+        add(f"    Average Speed: {avg_kph} km/h || {avg_mph} mph")
 
-    print(f"    Average Climb Rate: {stats['avg_climb_rate']} m/s || {convert_ms_to_fpm(stats['avg_climb_rate'])} fpm")
-    print(f"    Cruise Efficiency: {stats['cruise_efficiency']}%")
+    add(f"    Average Climb Rate: {stats['avg_climb_rate']} m/s || {convert_ms_to_fpm(stats['avg_climb_rate'])} fpm")
+    add(f"    Cruise Efficiency: {stats['cruise_efficiency']}%")
 
-    print(f"\n  INTERPRETATION:")
+    add()
+    add("  INTERPRETATION:")
     if stats['cruise_efficiency'] > 90:
-        print(f"    Excellent cruise efficiency - consistent glide performance")
+        add("    Excellent cruise efficiency - consistent glide performance")
     elif stats['cruise_efficiency'] > 75:
-        print(f"    Good cruise efficiency")
+        add("    Good cruise efficiency")
     else:
-        print(f"    Consider optimizing cruise speed for conditions")
+        add("    Consider optimizing cruise speed for conditions")
 
-    print("\tTop 5 Glides by L/D:")
+    add("\tTop 5 Glides by L/D:")
     for i, g in enumerate(stats['glide_blocks'][:5], 1):
-        print(
-            f"\t  #{i}: L/D {g['l_d']}:1 | Alt {int(g['altitude'])}m | Sink {g['sink_rate']} m/s | Dist {int(g['distance'])}m")
+        add(f"\t  #{i}: L/D {g['l_d']}:1 | Alt {int(g['altitude'])}m | Sink {g['sink_rate']} m/s | Dist {int(g['distance'])}m")
 
-    print("\nPolar Glide Curve (sink rate vs glide ratio):")
-    print("-" * 40)
-    print(f"  {'Sink (m/s)':<12} {'L/D':<8} {'Alt (m)':<10}")
-    print("-" * 40)
+    add()
+    add("Polar Glide Curve (sink rate vs glide ratio):")
+    add("-" * 40)
+    add(f"  {'Sink (m/s)':<12} {'L/D':<8} {'Alt (m)':<10}")
+    add("-" * 40)
     shown = set()
     for target in range(5, 16):
         best = min(stats['glide_polar'], key=lambda g: abs(g['l_d'] - target))
         key = (best['sink_rate'], best['l_d'], best['altitude'])
         if key not in shown:
             shown.add(key)
-            print(f"  {best['sink_rate']:<12.2f} {best['l_d']:<8.2f} {int(best['altitude']):<10}")
+            add(f"  {best['sink_rate']:<12.2f} {best['l_d']:<8.2f} {int(best['altitude']):<10}")
         if len(shown) >= 10:
             break
 
 
-def display_thermal_analysis(s):
-    print("THERMAL ANALYSIS:")
+def thermal_lines(s, add):
+    add("THERMAL ANALYSIS:", kind="heading")
     thermals = s["thermals"]
-    print(f"  Thermal Count: {thermals['thermal_count']}")
+    add(f"  Thermal Count: {thermals['thermal_count']}")
     if thermals['thermal_count'] == 0:
-        print("  No thermals detected (no circling behavior found)")
+        add("  No thermals detected (no circling behavior found)")
         return
 
-    print(f"  Average Thermal Strength: {thermals['avg_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['avg_thermal_strength'])} fpm")
-    print(f"  Max Thermal Strength: {thermals['max_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['max_thermal_strength'])} fpm")
-    print(f"  Min Thermal Strength: {thermals['min_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['min_thermal_strength'])} fpm")
-    print(f"  Average Thermal Duration: {thermals['avg_thermal_duration']} seconds")
-    print(f"  Total Time in Thermals: {thermals['total_thermal_time']} seconds ({thermals['thermal_time_pct']}% of flight)")
-    print(f"  Average Altitude Gain per Thermal: {thermals['avg_alt_gain']} m || {convert_meters_to_feet(thermals['avg_alt_gain'])} ft")
-    print(f"  Total Altitude Gained in Thermals: {thermals['total_alt_gain']} m || {convert_meters_to_feet(thermals['total_alt_gain'])} ft")
+    add(f"  Average Thermal Strength: {thermals['avg_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['avg_thermal_strength'])} fpm")
+    add(f"  Max Thermal Strength: {thermals['max_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['max_thermal_strength'])} fpm")
+    add(f"  Min Thermal Strength: {thermals['min_thermal_strength']} m/s || {convert_ms_to_fpm(thermals['min_thermal_strength'])} fpm")
+    add(f"  Average Thermal Duration: {thermals['avg_thermal_duration']} seconds")
+    add(f"  Total Time in Thermals: {thermals['total_thermal_time']} seconds ({thermals['thermal_time_pct']}% of flight)")
+    add(f"  Average Altitude Gain per Thermal: {thermals['avg_alt_gain']} m || {convert_meters_to_feet(thermals['avg_alt_gain'])} ft")
+    add(f"  Total Altitude Gained in Thermals: {thermals['total_alt_gain']} m || {convert_meters_to_feet(thermals['total_alt_gain'])} ft")
 
     for i, thermal in enumerate(thermals['circling_blocks'], 1):
         alt_gain = thermal['altitude_end_m'] - thermal['altitude_start_m']
-        print(f"\n  Thermal #{i}:")
-        print(f"    Duration: {thermal['time_secs']}s | Strength: {thermal['avg_lift_sink_ms']} m/s ({convert_ms_to_fpm(thermal['avg_lift_sink_ms'])} fpm)")
-        print(f"    Altitude: {thermal['altitude_start_m']} m -> {thermal['altitude_end_m']} m (gain: {alt_gain}m)")
-        print(f"              {convert_meters_to_feet(thermal['altitude_start_m'])} ft -> {convert_meters_to_feet(thermal['altitude_end_m'])} ft (gain: {convert_meters_to_feet(alt_gain)} ft)")
-        print(f"    Location: {thermal['loc_start']}")
+        add()
+        add(f"  Thermal #{i}:")
+        add(f"    Duration: {thermal['time_secs']}s | Strength: {thermal['avg_lift_sink_ms']} m/s ({convert_ms_to_fpm(thermal['avg_lift_sink_ms'])} fpm)")
+        add(f"    Altitude: {thermal['altitude_start_m']} m -> {thermal['altitude_end_m']} m (gain: {alt_gain}m)")
+        add(f"              {convert_meters_to_feet(thermal['altitude_start_m'])} ft -> {convert_meters_to_feet(thermal['altitude_end_m'])} ft (gain: {convert_meters_to_feet(alt_gain)} ft)")
+        add(f"    Location: {thermal['loc_start']}")
 
 
-def display_summary_stats(s):
+def report_summary(s):
+    # headline values of the report, carried as data in the JSON output
+    return {"file": s['filename'].split('/')[-1],
+            "pilot": s['pilot'],
+            "glider": s['glider'],
+            "flight_type": s['flight_type'],
+            "date": s['flight_date'].strftime("%Y-%m-%d"),
+            "duration_s": s['duration'],
+            "takeoff_datetime": s['takeoff_datetime'],
+            "landing_datetime": s['landing_datetime'],
+            "total_distance_km": s['total_distance'],
+            "max_alt_m": s['max_alt'],
+            "max_lift_ms": s['max_lift'],
+            "max_sink_ms": s['max_sink'],
+            "climb_grade": s['climb_grade']}
+
+
+def footer_lines(add):
+    # End Email/Analysis Text
+    _gap(add, 5)
+    add("Analysis Complete - KML file for Google Earth attached.")
+    add("Thanks for using the WanderBot IGC analyzer.")
+    add()
+    add("\tBlue skies!!")
+    add("\tWander Expeditions LLC")
+    _gap(add, 2)
+
+
+# Core Functions ---------------------------------------------------------------------------|
+@timed("report", lambda s, *args: s.get("timings"))
+def build_report(s, footer=True):
     """
         The efficiency score (0-100%) is a weighted composite of four factors:
         - Net Efficiency (35%): Actual altitude gain vs. expected gain based on global average climb rate
@@ -183,59 +246,207 @@ def display_summary_stats(s):
 
     formatted_date = dt.datetime.strftime(s['flight_date'], "%d %b %Y")
     formatted_duration = str(dt.timedelta(seconds=s["duration"]))
+    lines = []
+    add = _adder(lines)
 
-    print("\nFLIGHT:")
-    print(f"  File: {s['filename'].split('/')[-1]}")
-    print(f"  Pilot: {s['pilot']}")
-    print(f"  Glider: {s['glider']}")
-    print(f"  Vario: {s['vario']}")
-    print("\n\n")
-    print("STATISTICS:")
-    print(f"  Flight Type: {s['flight_type'].upper()}")
-    print(f"  Date: {formatted_date}")
-    print(f"  Duration: {formatted_duration}")
-    print(f"  Takeoff GPS: {s['takeoff_gps']}")
-    print(f"  Takeoff DateTime: {s['takeoff_datetime']}")
-    print(f"  Takeoff Altitude: {s['takeoff_alt']} m || {convert_meters_to_feet(s['takeoff_alt'])} ft")
-    print(f"  Takeoff Heading: {s['takeoff_heading']}°")
-    print(f"  Landing GPS: {s['landing_gps']}")
-    print(f"  Landing DateTime: {s['landing_datetime']}")
-    print(f"  Landing Altitude: {s['landing_alt']} m || {convert_meters_to_feet(s['landing_alt'])} ft")
-    print(f"  Landing Heading: {s['landing_heading']}°")
-    print(f"  Distance Total: {s['total_distance']} km || {convert_km_to_miles(s['total_distance'])} mi")
-    print(f"  Flight Area Diameter: {s['flight_area_diameter']} km || {convert_km_to_miles(s['flight_area_diameter'])} mi")
-    print(f"  Takeoff to Landing: {s['takeoff_to_land_dist']} km || {convert_km_to_miles(s['takeoff_to_land_dist'])} mi")
-    print(f"  Max Altitude: {s['max_alt']} m || {convert_meters_to_feet(s['max_alt'])} ft")
-    print(f"  Max Lift: {s['max_lift']} m/s || {convert_ms_to_fpm(s['max_lift'])} ft/min")
-    print(f"  Max Sink: {s['max_sink']} m/s || {convert_ms_to_fpm(s['max_sink'])} ft/min")
-    print("\n\n")
+    add()
+    add("FLIGHT:", kind="heading")
+    add(f"  File: {s['filename'].split('/')[-1]}")
+    add(f"  Pilot: {s['pilot']}")
+    add(f"  Glider: {s['glider']}")
+    add(f"  Vario: {s['vario']}")
+    _gap(add)
+    add("STATISTICS:", kind="heading")
+    add(f"  Flight Type: {s['flight_type'].upper()}")
+    add(f"  Date: {formatted_date}")
+    add(f"  Duration: {formatted_duration}")
+    add(f"  Takeoff GPS: {s['takeoff_gps']}")
+    add(f"  Takeoff DateTime: {s['takeoff_datetime']}")
+    add(f"  Takeoff Altitude: {s['takeoff_alt']} m || {convert_meters_to_feet(s['takeoff_alt'])} ft")
+    add(f"  Takeoff Heading: {s['takeoff_heading']}°")
+    add(f"  Landing GPS: {s['landing_gps']}")
+    add(f"  Landing DateTime: {s['landing_datetime']}")
+    add(f"  Landing Altitude: {s['landing_alt']} m || {convert_meters_to_feet(s['landing_alt'])} ft")
+    add(f"  Landing Heading: {s['landing_heading']}°")
+    add(f"  Distance Total: {s['total_distance']} km || {convert_km_to_miles(s['total_distance'])} mi")
+    add(f"  Flight Area Diameter: {s['flight_area_diameter']} km || {convert_km_to_miles(s['flight_area_diameter'])} mi")
+    add(f"  Takeoff to Landing: {s['takeoff_to_land_dist']} km || {convert_km_to_miles(s['takeoff_to_land_dist'])} mi")
+    add(f"  Max Altitude: {s['max_alt']} m || {convert_meters_to_feet(s['max_alt'])} ft")
+    add(f"  Max Lift: {s['max_lift']} m/s || {convert_ms_to_fpm(s['max_lift'])} ft/min")
+    add(f"  Max Sink: {s['max_sink']} m/s || {convert_ms_to_fpm(s['max_sink'])} ft/min")
+    _gap(add)
     grade = s['climb_grade']
-    if grade >= 75:
-        gc = C_CLIMB
-    elif grade >= 45:
-        gc = C_GLIDE
-    else:
-        gc = C_SINK
-    print(f"{C_TITLE}EFFICIENCY GRADE:{C_END}")
-    print(f"  ({s.get('flight_type', 'thermal').upper()}): {gc}{grade}%{C_END}")
-    narative = efficiency_grade_lookup(grade, s.get('flight_type', 'thermal'))
-    print(f"\t{narative}")
+    flight_type = s.get('flight_type', 'thermal')
+    add(("EFFICIENCY GRADE:", "title"), kind="heading")
+    add(f"  ({flight_type.upper()}): ", (f"{grade}%", _grade_style(grade)))
+    add(f"\t{efficiency_grade_lookup(grade, flight_type)}")
 
-    print("\n\n")
-    display_glide_analysis(s)
+    _gap(add)
+    glide_lines(s, add)
 
     if s['flight_type'] != 'soaring':
-        print("\n\n")
-        display_thermal_analysis(s)
+        _gap(add)
+        thermal_lines(s, add)
 
-    print("\n\n")
-    print("DETAILED FLIGHT INSPECTION OF BLOCKS OVER 90 SECONDS LONG:")
-    print(f"\tBlocks in Flight: {len(s['details'])}\n")
-    large_blocks = [x for x in s["details"] if x['time_secs'] > 90]
-    display_details(large_blocks)
+    _gap(add)
+    add("DETAILED FLIGHT INSPECTION OF BLOCKS OVER 90 SECONDS LONG:", kind="heading")
+    add(f"\tBlocks in Flight: {len(s['details'])}")
+    add()
+    detail_lines([x for x in s["details"] if x['time_secs'] > 90], add)
 
-    print("\n\n")
-    # End Email/Analysis Text
-    print("\n\nAnalysis Complete - KML file for Google Earth attached.")
-    print("Thanks for using the WanderBot IGC analyzer.")
-    print("\n\tBlue skies!!\n\tWander Expeditions LLC\n\n")
+    if footer:
+        footer_lines(add)
+    return {"title": f"Flight analysis: {s['filename'].split('/')[-1]}", "summary": report_summary(s),
+            "lines": lines}
+
+
+def flight_report(report, notes=()):
+    # a report built with footer=False, completed with notes & the footer
+    lines = list(report["lines"])
+    add = _adder(lines)
+    for note in notes:
+        add()
+        add(note)
+    footer_lines(add)
+    return {**report, "lines": lines}
+
+
+def build_day_report(reports, notes=()):
+    # several flights in one report: a day summary table, then each flight's report (built with
+    # footer=False, e.g. straight from the reply cache) & the notes
+    lines = []
+    add = _adder(lines)
+    summaries = [report["summary"] for report in reports]
+    airtime = sum(x['duration_s'] for x in summaries)
+    distance = round(sum(x['total_distance_km'] for x in summaries), 1)
+    max_alt = max((x['max_alt_m'] for x in summaries), default=0)
+
+    add()
+    add(("DAY SUMMARY:", "title"), kind="heading")
+    add(f"  Flights: {len(summaries)}")
+    add(f"  Total Airtime: {dt.timedelta(seconds=int(airtime))}")
+    add(f"  Total Distance: {distance} km || {convert_km_to_miles(distance)} mi")
+    add(f"  Highest Altitude: {max_alt} m || {convert_meters_to_feet(max_alt)} ft")
+    add()
+    add(f"  {'#':<3} {'File':<30} {'Takeoff':<19} {'Duration':>8} {'Dist km':>8} {'Max m':>6} {'Grade':>7}")
+    add("  " + "-" * 87)
+    for i, x in enumerate(summaries, 1):
+        add(f"  {i:<3} {x['file'][:30]:<30} {x['takeoff_datetime']:<19} "
+            f"{str(dt.timedelta(seconds=int(x['duration_s']))):>8} {x['total_distance_km']:>8} {x['max_alt_m']:>6} ",
+            (f"{x['climb_grade']:>6}%", _grade_style(x['climb_grade'])))
+    for note in notes:
+        add()
+        add(note)
+
+    for i, report in enumerate(reports, 1):
+        _gap(add)
+        add((f"FLIGHT {i} OF {len(reports)}: {report['summary']['file']}", "title"), kind="heading")
+        lines.extend(report["lines"])
+    footer_lines(add)
+    totals = {"flight_count": len(summaries), "airtime_s": airtime, "total_distance_km": distance, "max_alt_m": max_alt}
+    return {"title": f"Day analysis: {len(summaries)} flights", "summary": {**totals, "flights": summaries},
+            "lines": lines}
+
+
+def _render_text(lines, styles=None):
+    # styles: ANSI codes per style (None: plain text); a code is written where the style changes and
+    # reset where styled text ends
+    out = []
+    for _, spans in lines:
+        parts = []
+        current = None
+        for span in spans:
+            text, style = (span, None) if span.__class__ is str else span
+            if styles is not None and style != current:
+                parts.append(styles[style] if style else C_END)
+                current = style
+            parts.append(text)
+        if current:
+            parts.append(C_END)
+        out.append("".join(parts))
+    return "\n".join(out) + "\n"
+
+
+def _html_span(span):
+    text, style = (span, None) if span.__class__ is str else span
+    if style is None:
+        return html.escape(text, quote=False)
+    return f'<span style="{HTML_STYLES[style]}">{html.escape(text, quote=False)}</span>'
+
+
+def _render_html(report):
+    parts = ['<!DOCTYPE html>\n<html><head><meta charset="utf-8">',
+             f'<title>{html.escape(report["title"])}</title></head>\n',
+             '<body style="font-family:Helvetica,Arial,sans-serif;color:#202020">\n']
+    block = []
+
+    def flush():
+        while block and not block[-1]:
+            block.pop()
+        if block:
+            parts.append(f'<pre style="{HTML_PRE}">' + "\n".join(block) + '</pre>\n')
+        block.clear()
+
+    for kind, spans in report["lines"]:
+        content = "".join(map(_html_span, spans))
+        if kind == "heading":
+            flush()
+            parts.append(f'<h3 style="margin:18px 0 6px">{content}</h3>\n')
+        elif block or kind == "text":  # blank lines only count inside a block
+            block.append(content)
+    flush()
+    parts.append('</body></html>\n')
+    return "".join(parts)
+
+
+def _render_json(report):
+    sections = []
+    for kind, spans in report["lines"]:
+        if kind == "blank":
+            continue
+        text = "".join(span if span.__class__ is str else span[0] for span in spans)
+        if kind == "heading":
+            sections.append({"heading": text.rstrip(":"), "lines": []})
+        else:
+            if not sections:
+                sections.append({"heading": None, "lines": []})
+            sections[-1]["lines"].append(text)
+    return json.dumps({"title": report["title"], "summary": report["summary"], "sections": sections},
+                      ensure_ascii=False, default=str)
+
+
+def render_report(report, fmt="text"):
+    # fmt: "text" (plain, the email body), "ansi" (terminal colors), "html" (email body) or "json"
+    if fmt == "text":
+        return _render_text(report["lines"])
+    elif fmt == "ansi":
+        return _render_text(report["lines"], ANSI_STYLES)
+    elif fmt == "html":
+        return _render_html(report)
+    elif fmt == "json":
+        return _render_json(report)
+    raise ValueError(f"Unknown report format: {fmt}")
+
+
+def _print_lines(build, *args):
+    lines = []
+    build(*args, _adder(lines))
+    print(_render_text(lines, ANSI_STYLES), end="")
+
+
+def display_details(details):
+    _print_lines(detail_lines, details)
+
+
+def display_glide_analysis(s):
+    _print_lines(glide_lines, s)
+
+
+def display_thermal_analysis(s):
+    _print_lines(thermal_lines, s)
+
+
+@timed("display", lambda s: s.get("timings"))
+def display_summary_stats(s):
+    # the report in terminal colors on stdout
+    print(render_report(build_report(s), "ansi"), end="")
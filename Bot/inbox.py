@@ -0,0 +1,98 @@
+# IMAP Inbox helpers: connection & IDLE (RFC 2177) push notifications on top of imaplib
+import imaplib
+import itertools
+import select
+import ssl
+import time
+
+IDLE_REPLY_TIMEOUT = 30  # seconds to wait for the server's answer to IDLE / DONE
+
+_idle_tags = (f"IDLE{n}".encode() for n in itertools.count(1))  # our own tags, imaplib's are not touched
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def _buffered(mail):
+    # True when a server line can be read without blocking: imaplib's reader holds bytes it read ahead,
+    # or the socket has (TLS-decrypted) bytes. The non-blocking peek leaves the reader usable, a read
+    # timeout would not
+    sock = mail.socket()
+    timeout = sock.gettimeout()
+    sock.settimeout(0)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+
+def _wait_line(mail, wake, timeout):
+    # True when a server line is ready for mail.readline(), False on timeout or when wake was signalled
+    if _buffered(mail):
+        return True
+    sock = mail.socket()
+    readable = select.select([sock] + ([wake] if wake is not None else []), [], [], max(0, timeout))[0]
+    if wake is not None and wake in readable:
+        wake.recv(4096)  # drain the wake-ups
+        return sock in readable
+    return bool(readable)
+
+
+def _read_line(mail):
+    # next server line through imaplib's own reader, within IDLE_REPLY_TIMEOUT
+    if not _wait_line(mail, None, IDLE_REPLY_TIMEOUT):
+        raise imaplib.IMAP4.abort("no reply to IDLE / DONE")
+    return mail.readline()
+
+
+def _is_new_mail(line):
+    words = line.split()
+    return len(words) >= 3 and words[0] == b"*" and words[2].upper() in (b"EXISTS", b"RECENT")
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def connect(server, user, password, port=None, ssl=True, mailbox="INBOX"):
+    # logged-in IMAP session with mailbox selected; ssl=False talks plain IMAP (e.g. a local test server)
+    imap = imaplib.IMAP4_SSL if ssl else imaplib.IMAP4
+    mail = imap(server, port) if port else imap(server)
+    mail.login(user, password)
+    mail.select(mailbox)
+    return mail
+
+
+def supports_idle(mail):
+    return "IDLE" in mail.capabilities
+
+
+def idle(mail, timeout, wake=None):
+    # IDLE on the selected mailbox for up to timeout seconds; True when the server reported new mail
+    # (EXISTS / RECENT). wake: a socket whose readability ends the IDLE early (e.g. a job finished).
+    # Re-IDLE before the server's inactivity timeout (29 min per RFC 2177).
+    tag = next(_idle_tags)
+    mail.send(tag + b" IDLE\r\n")
+    line = _read_line(mail)
+    if not line.startswith(b"+"):
+        raise imaplib.IMAP4.error(f"IDLE not accepted: {line!r}")
+
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    while not new_mail and _wait_line(mail, wake, deadline - time.monotonic()):
+        new_mail = _is_new_mail(mail.readline())
+
+    mail.send(b"DONE\r\n")
+    while True:
+        line = _read_line(mail)
+        if line.startswith(tag + b" "):
+            if line[len(tag) + 1:].upper().startswith(b"OK"):
+                return new_mail
+            raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+        new_mail = new_mail or _is_new_mail(line)
+
+
+def logout(mail):
+    # end a session that may already be broken (before reconnecting) without waiting on a dead server
+    try:
+        mail.socket().settimeout(IDLE_REPLY_TIMEOUT)
+        mail.logout()
+    except Exception:
+        pass
@@ -0,0 +1,86 @@
+# Incremental (online) Flight Analysis
+from decode import parse_header_line, parse_b_record, fix_stepper, new_segmenter, segment_fix, open_block, \
+    block_detail, detect_circling, grade_blocks, compile_results, TYYPE_LOOKUP
+from track import FlightTrack
+
+
+class IncrementalAnalyzer:
+    """ Live version of load_igc(): IGC lines are fed one at a time or in batches, in time order.
+
+    feed() only does work for the lines it is given (amortized O(batch)) and returns what changed:
+    the blocks closed by the batch, thermals among them and the current climb/glide/sink state.
+    analysis() / results() grade the blocks so far (O(blocks)); once the whole log has been fed they
+    equal flight_analyzer() / load_igc() for the same file.
+    """
+
+    def __init__(self, filename="flight.igc", keep_track=False):
+        self.filename = filename
+        self.flight = {"pilot": "", "vario": "", "glider": "", "raw_utc_date": None}
+        self.track = FlightTrack() if keep_track else None
+        self.blocks = []  # closed blocks, as iter_blocks() yields them
+        self.details = []  # block_detail() of each closed block
+        self.thermals = []  # closed blocks passing the detect_circling() rules
+        self.fixes = 0
+        self.last_fix = None
+        self._step = fix_stepper(self.flight)
+        next(self._step)
+        self._segmenter = new_segmenter()
+
+    def feed(self, lines):
+        # lines: one IGC line or an iterable of them (str or bytes); H-Records fill the header
+        if isinstance(lines, (str, bytes)):
+            lines = (lines,)
+        closed = []
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("latin-1")
+            if not line:
+                continue
+            if line[0] == "H":
+                parse_header_line(line, self.flight)
+            elif line[0] == "B":
+                fix = self._step.send(parse_b_record(line, self.flight["raw_utc_date"]))
+                if self.track is not None:
+                    self.track.append(fix)
+                self.fixes += 1
+                self.last_fix = fix
+                block = segment_fix(self._segmenter, fix)
+                if block is not None:
+                    closed.append(self._add_block(block))
+
+        new_thermals = detect_circling(closed)
+        self.thermals.extend(new_thermals)
+        return {"blocks": closed, "thermals": new_thermals, "state": self.state()}
+
+    def _add_block(self, block):
+        detail = block_detail(len(self.blocks), block)
+        self.blocks.append(block)
+        self.details.append(detail)
+        return detail
+
+    def state(self):
+        # where the flight is now: the block in progress & the latest fix
+        block = self._segmenter["block"]
+        fix = self.last_fix
+        return {"fixes": self.fixes,
+                "blocks": len(self.blocks) + (block is not None),
+                "phase": TYYPE_LOOKUP[block["cat"]] if block is not None else None,
+                "phase_secs": block["stop"] - block["start"] if block is not None else 0,
+                "altitude_m": fix[3] if fix is not None else None,
+                "location": (fix[1], fix[2]) if fix is not None else None}
+
+    def current_blocks(self):
+        # closed blocks plus the one in progress, closed as if the log ended here
+        block = open_block(self._segmenter)
+        return self.blocks if block is None else self.blocks + [block]
+
+    def analysis(self):
+        # running grades: flight_analyzer() output for the fixes fed so far
+        self._step.send(None)  # refresh takeoff/landing/max values in flight
+        return grade_blocks(self.current_blocks(), self.flight["flight_area_km"])
+
+    def results(self):
+        # load_igc() results for the fixes fed so far (needs a detected takeoff)
+        analysis = self.analysis()
+        return compile_results(self.filename, dict(self.flight), analysis,
+                               self.track if self.track is not None else FlightTrack())
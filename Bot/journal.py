@@ -0,0 +1,184 @@
+# Job Journal: crash-safe record of the bot's messages through received -> analyzed -> replied -> done
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Constants -------------------------------------/
+JOURNAL_PATH = Path(os.getenv("JOURNAL_PATH", Path(__file__).parent.parent / "Log" / "jobs.db"))
+JOURNAL_KEEP_DAYS = int(os.getenv("JOURNAL_KEEP_DAYS", "30"))  # finished jobs are kept this long as a trace
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    uid TEXT PRIMARY KEY,
+    sender TEXT,
+    notes TEXT,
+    state TEXT NOT NULL,
+    received_at REAL,
+    updated_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL NOT NULL DEFAULT 0,
+    notified INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS attachments (
+    uid TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    payload BLOB,
+    result BLOB,
+    archived INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (uid, idx)
+);
+CREATE INDEX IF NOT EXISTS messages_state ON messages (state);
+"""
+ADDED_COLUMNS = {"messages": {"attempts": "INTEGER NOT NULL DEFAULT 0", "retry_at": "REAL NOT NULL DEFAULT 0",
+                              "notified": "INTEGER NOT NULL DEFAULT 0"},
+                 "attachments": {"archived": "INTEGER NOT NULL DEFAULT 0"}}  # for journals created without them
+
+
+# Core Functions ---------------------------------------------------------------------------|
+class Journal:
+    """ SQLite job journal, the bot's source of truth for what happened to each message.
+
+    A message is 'received' once its IGC attachments are journaled (payloads included, so the job can
+    be redone without the mail server), 'analyzed' once every attachment has a stored result, 'replied'
+    once the reply was accepted, and 'done' once it is flagged \\Seen. After a crash the bot resumes
+    from the last recorded state: finished analyses are not rerun and sent replies are not resent.
+    A failed job keeps its state and counts an attempt, with the time it may be retried (retry_at);
+    'notified' records that its error notifications were sent, so a retry does not send them again.
+
+    WAL mode with synchronous=NORMAL: a state change is one short transaction appended to the
+    write-ahead log, without an fsync of its own (the log is synced at checkpoints). That survives a
+    crash of the process; only a power loss can lose the last few state changes, which then redoes
+    that work. Safe to call from several threads.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        for table, added in ADDED_COLUMNS.items():
+            columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+            for name, definition in added.items():
+                if name not in columns:
+                    self._db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        self._lock = threading.Lock()
+
+    def _write(self, *statements):
+        # (sql, params) statements applied in one transaction
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._db.execute(sql, params)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # State changes -----------------------------------------------------------------------|
+    def received(self, uid, sender, flights, notes):
+        # a new job (or a message marked unread again after it was done): flights is [(filename, payload)].
+        # Attempts & sent notices carry over from a failed start, a done message starts afresh
+        now = time.time()
+        self._write(("DELETE FROM attachments WHERE uid = ?", (uid,)),
+                    ("INSERT INTO messages (uid, sender, notes, state, received_at, updated_at) "
+                     "VALUES (?, ?, ?, 'received', ?, ?) ON CONFLICT (uid) DO UPDATE SET "
+                     "sender = excluded.sender, notes = excluded.notes, received_at = excluded.received_at, "
+                     "updated_at = excluded.updated_at, "
+                     "attempts = CASE WHEN state = 'done' THEN 0 ELSE attempts END, "
+                     "notified = CASE WHEN state = 'done' THEN 0 ELSE notified END, "
+                     "retry_at = 0, state = 'received'",
+                     (uid, sender, json.dumps(notes), now, now)),
+                    *(("INSERT INTO attachments (uid, idx, filename, payload) VALUES (?, ?, ?, ?)",
+                       (uid, i, filename, payload))
+                      for i, (filename, payload) in enumerate(flights)))
+
+    def analyzed(self, uid, idx, result):
+        # one attachment's result (its payload is no longer needed); the message is 'analyzed' with the last one
+        self._write(("UPDATE attachments SET result = ?, payload = NULL WHERE uid = ? AND idx = ?",
+                     (pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), uid, idx)),
+                    ("UPDATE messages SET state = 'analyzed', updated_at = ? WHERE uid = ? AND state = 'received' "
+                     "AND NOT EXISTS (SELECT 1 FROM attachments WHERE uid = ? AND result IS NULL)",
+                     (time.time(), uid, uid)))
+
+    def replied(self, uid):
+        self._write(("UPDATE messages SET state = 'replied', updated_at = ? WHERE uid = ?", (time.time(), uid)))
+
+    def failed(self, uid, delay_s, max_delay_s):
+        # one more failed attempt, retried after delay_s doubled per earlier attempt (at most max_delay_s);
+        # returns the attempt count. A message that failed before it was journaled gets a 'new' row
+        now = time.time()
+        self._write(("INSERT INTO messages (uid, state, received_at, updated_at) VALUES (?, 'new', ?, ?) "
+                     "ON CONFLICT (uid) DO NOTHING", (uid, now, now)),
+                    ("UPDATE messages SET retry_at = ? + MIN(? * (1 << MIN(attempts, 30)), ?), "
+                     "attempts = attempts + 1, updated_at = ? WHERE uid = ?",
+                     (now, delay_s, max_delay_s, now, uid)))
+        with self._lock:
+            return self._db.execute("SELECT attempts FROM messages WHERE uid = ?", (uid,)).fetchone()[0]
+
+    def archived(self, uid, idx):
+        # the attachment's copy is in the IGC archive: a resumed job does not archive it again
+        self._write(("UPDATE attachments SET archived = 1 WHERE uid = ? AND idx = ?", (uid, idx)))
+
+    def notified(self, uid):
+        # the error notifications of the message went out: they are not sent again on a retry
+        self._write(("UPDATE messages SET notified = 1, updated_at = ? WHERE uid = ?", (time.time(), uid)))
+
+    def done(self, uid):
+        # flagged \Seen: the stored payloads & results are dropped, the message row stays as a trace
+        self._write(("DELETE FROM attachments WHERE uid = ?", (uid,)),
+                    ("UPDATE messages SET state = 'done', updated_at = ? WHERE uid = ?", (time.time(), uid)))
+
+    def prune(self, keep_days=JOURNAL_KEEP_DAYS):
+        self._write(("DELETE FROM messages WHERE state = 'done' AND updated_at < ?",
+                     (time.time() - keep_days * 86400,)))
+
+    # Reading -----------------------------------------------------------------------------|
+    def state(self, uid):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM messages WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
+
+    def retry_at(self, uid):
+        # when a failed job may run again (0: right away)
+        with self._lock:
+            row = self._db.execute("SELECT retry_at FROM messages WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else 0
+
+    def next_retry(self):
+        # the earliest pending retry time of the unfinished jobs, None if there is none
+        with self._lock:
+            return self._db.execute("SELECT MIN(retry_at) FROM messages WHERE state != 'done' AND retry_at > ?",
+                                    (time.time(),)).fetchone()[0]
+
+    def load(self, uid):
+        # a journaled job: sender, notes, [(filename, payload)], the stored results (None: not analyzed)
+        # & whether its error notifications were already sent
+        with self._lock:
+            sender, notes, notified = self._db.execute("SELECT sender, notes, notified FROM messages WHERE uid = ?",
+                                                       (uid,)).fetchone()
+            rows = self._db.execute("SELECT filename, payload, result FROM attachments WHERE uid = ? ORDER BY idx",
+                                    (uid,)).fetchall()
+        flights = [(filename, payload) for filename, payload, _ in rows]
+        results = [pickle.loads(result) if result is not None else None for _, _, result in rows]
+        return sender, json.loads(notes), flights, results, bool(notified)
+
+    def unarchived(self, uid):
+        # [(idx, filename, payload)] of the attachments not archived yet whose payload is still stored
+        with self._lock:
+            return self._db.execute("SELECT idx, filename, payload FROM attachments WHERE uid = ? AND archived = 0 "
+                                    "AND payload IS NOT NULL ORDER BY idx", (uid,)).fetchall()
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM messages GROUP BY state").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,5 +1,28 @@
+import io
+import math
 import os
-from base import haversine
+import zipfile
+from datetime import datetime, timedelta
+from itertools import repeat
+from xml.sax.saxutils import escape
+
+from base import settings, EARTH_RADIUS_KM
+from decode import annotate_blocks, detect_circling
+from timing import timed
+
+
+WRITE_BUFFER = 1024 * 1024
+METERS_PER_DEG = EARTH_RADIUS_KM * 1000 * math.pi / 180
+SIMPLIFY_SPAN = 1000  # longest chord of simplify_indices(), in fixes (~17 min at 1 Hz)
+# KML color format is aabbggrr
+SEGMENT_COLORS = {
+    "climb_green": "ff00ff00",
+    "climb_yellow": "ff00ffff",
+    "climb_orange": "ff0080ff",
+    "climb_red": "ff0000ff",
+    "glide_green": "ff00ff00",
+    "sink_red": "ff0000ff",
+}
 
 
 # Helper Functions -----------------------------------------------------|
@@ -15,240 +38,391 @@ def get_color_name(color_key):
     return names.get(color_key, "Track")
 
 
-def find_block_for_altitude(coord, blocks):
-    for block in blocks:
-        loc = block.get('loc_start', (0, 0))
-        loc_end = block.get('loc_end', (0, 0))
-        lat, lon = coord[1], coord[0]
-        if (min(loc[0], loc_end[0]) <= lat <= max(loc[0], loc_end[0]) and
-            min(loc[1], loc_end[1]) <= lon <= max(loc[1], loc_end[1])):
-            return block
-    return None
+def time_ordered_track(kml_data):
+    # the track in file order, sorted only when its fixes really are out of order (as flight_analyzer() does)
+    track = kml_data.get("track")
+    if track is not None and not track.is_time_ordered():
+        track = track.sorted_by_time()
+    return track
+
+
+def track_points(kml_data, track=None):
+    # (lon, lat, alt) per fix from the FlightTrack (in time order, as the details' fix indices are),
+    # or from a plain lon_lat_alt_list
+    track = track or time_ordered_track(kml_data)
+    if track is not None:
+        return track.lon_lat_alt()
+    return iter(kml_data.get("lon_lat_alt_list", []))
+
+
+def iter_fix_times(times):
+    # track times (DDMMYYHHMMSS) -> datetimes, a day later each time the clock wraps past midnight
+    # (B-Records only carry the time of day)
+    offset = timedelta(0)
+    last = None
+    for t in times:
+        date, clock = divmod(t, 1000000)
+        stamp = datetime(2000 + date % 100, date // 100 % 100, date // 10000,
+                         clock // 10000, clock // 100 % 100, clock % 100) + offset
+        if last is not None and stamp < last:
+            offset += timedelta(days=1)
+            stamp += timedelta(days=1)
+        last = stamp
+        yield stamp
+
+
+def decimate_indices(stamps, step_s):
+    # indices keeping at most one fix per step_s seconds (both ends always kept)
+    n = len(stamps)
+    if n < 3 or not step_s or step_s <= 1:
+        return range(n)
+    step = timedelta(seconds=step_s)
+    kept = [0]
+    for i in range(1, n - 1):
+        if stamps[i] - stamps[kept[-1]] >= step:
+            kept.append(i)
+    kept.append(n - 1)
+    return kept
+
+
+def iter_fix_tyypes(details):
+    # block type (Climb/Glide/Sink) of every fix in track order, from the details' fix ranges;
+    # None for fixes outside any block (e.g. the unclassified tail)
+    position = 0
+    for block in sorted(details, key=lambda b: b['fix_start']):
+        yield from repeat(None, block['fix_start'] - position)
+        yield from repeat(block['tyype'], block['fix_end'] + 1 - block['fix_start'])
+        position = block['fix_end'] + 1
+    yield from repeat(None)
+
 
+def altitude_color(alti, alt_thresholds, lowest):
+    if alti >= alt_thresholds['orange']:
+        return "climb_red"
+    elif alti >= alt_thresholds['yellow']:
+        return "climb_orange"
+    elif alti >= alt_thresholds['green']:
+        return "climb_yellow"
+    return lowest
 
-def detect_thermals(details, min_alt_gain=50, max_drift_m=1000):
+
+def simplify_indices(points, tolerance_m):
+    # Douglas-Peucker over (lon, lat, alt) points in local meters: indices of the points to keep so that no
+    # dropped point is further than tolerance_m (3D) from the kept polyline; both ends are always kept
+    n = len(points)
+    if n < 3 or not tolerance_m:
+        return range(n)
+    x_scale = METERS_PER_DEG * math.cos(math.radians(points[0][1]))
+    xs = [p[0] * x_scale for p in points]
+    ys = [p[1] * METERS_PER_DEG for p in points]
+    zs = [float(p[2]) for p in points]
+    keep = bytearray(n)
+    # chords span at most SIMPLIFY_SPAN fixes: a pass costs O(span), so even when every split is lopsided
+    # (noisy or steadily curving tracks) the whole run stays O(n * SIMPLIFY_SPAN) instead of O(n^2)
+    stack = []
+    for first in range(0, n - 1, SIMPLIFY_SPAN):
+        keep[first] = 1
+        stack.append((first, min(first + SIMPLIFY_SPAN, n - 1)))
+    keep[-1] = 1
+    tolerance_sq = tolerance_m * tolerance_m
+    while stack:  # explicit stack: long straight glides would overflow recursion
+        first, last = stack.pop()
+        ax, ay, az = xs[first], ys[first], zs[first]
+        dx, dy, dz = xs[last] - ax, ys[last] - ay, zs[last] - az
+        length_sq = dx * dx + dy * dy + dz * dz
+        worst, worst_at = tolerance_sq, -1
+        for i in range(first + 1, last):
+            px, py, pz = xs[i] - ax, ys[i] - ay, zs[i] - az
+            if length_sq:  # distance to the chord as a segment (thermal circles end near where they start)
+                t = (px * dx + py * dy + pz * dz) / length_sq
+                t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                px, py, pz = px - t * dx, py - t * dy, pz - t * dz
+            d = px * px + py * py + pz * pz
+            if d > worst:
+                worst, worst_at = d, i
+        if worst_at >= 0:
+            keep[worst_at] = 1
+            stack.append((first, worst_at))
+            stack.append((worst_at, last))
+    return [i for i in range(n) if keep[i]]
+
+
+def detect_thermals(details):
+    # map markers for the blocks flagged circling by decode.annotate_blocks(), the same blocks the
+    # thermal report lists
     thermals = []
-    for block in details:
-        if block['tyype'] == 'Climb' and block['time_secs'] >= 20:
-            alt_gain = block['altitude_end_m'] - block['altitude_start_m']
-            if alt_gain >= min_alt_gain:
-                start_loc = block['loc_start']
-                end_loc = block['loc_end']
-                distance = haversine(start_loc, end_loc) * 1000
-                if distance < max_drift_m:
-                    thermals.append({
-                        'lat': start_loc[0],
-                        'lon': start_loc[1],
-                        'strength': block['avg_lift_sink_ms'],
-                        'alt_start': block['altitude_start_m'],
-                        'alt_end': block['altitude_end_m'],
-                        'duration': block['time_secs']
-                    })
+    for block in detect_circling(details):
+        start_loc = block['loc_start']
+        thermals.append({
+            'lat': start_loc[0],
+            'lon': start_loc[1],
+            'strength': block['avg_lift_sink_ms'],
+            'alt_start': block['altitude_start_m'],
+            'alt_end': block['altitude_end_m'],
+            'duration': block['time_secs']
+        })
     return thermals
 
 
 def detect_turnpoints(details):
-    turnpoints = []
-    for i, block in enumerate(details):
-        if i > 0 and i < len(details) - 1:
-            prev = details[i - 1]
-            next_block = details[i + 1]
-            if (prev['tyype'] == 'Glide' and block['tyype'] == 'Climb' and next_block['tyype'] == 'Glide'):
-                if abs(block['avg_lift_sink_ms'] - max(d['avg_lift_sink_ms'] for d in details if d['tyype'] == 'Climb')) < 0.5:
-                    turnpoints.append({
-                        'lat': block['loc_start'][0],
-                        'lon': block['loc_start'][1],
-                        'strength': block['avg_lift_sink_ms']
-                    })
-    return turnpoints
+    if any('turnpoint' not in b for b in details):
+        annotate_blocks(details)
+    return [{'lat': block['loc_start'][0],
+             'lon': block['loc_start'][1],
+             'strength': block['avg_lift_sink_ms']} for block in details if block['turnpoint']]
 
 
 # Core Functions -----------------------------------------------------|
-def create_enhanced_kml(kml_data):
-    try:
-        out_file = f"{kml_data['filename'].rsplit('.', 1)[0]}.kml"
-        if os.path.exists(out_file):
-            os.remove(out_file)
-
-        lon_lat_alt_list = kml_data.get("lon_lat_alt_list", [])
-        details = kml_data.get("details", [])
-        takeoff_gps = kml_data.get("takeoff_gps", None)
-        landing_gps = kml_data.get("landing_gps", None)
-
-        altis = [int(x[2]) for x in lon_lat_alt_list if int(x[2]) > 0]
-        if not altis:
-            return
-
-        sorted_altis = sorted(altis)
-        n = len(sorted_altis)
-        q1 = sorted_altis[int(n * 0.25)]
-        q2 = sorted_altis[int(n * 0.50)]
-        q3 = sorted_altis[int(n * 0.75)]
-
-        alt_thresholds = {
-            'green': q1,
-            'yellow': q2,
-            'orange': q3
-        }
-
-        # KML color format is aabbggrr
-        colors = {
-            "climb_green": "ff00ff00",
-            "climb_yellow": "ff00ffff",
-            "climb_orange": "ff0080ff",
-            "climb_red": "ff0000ff",
-            "glide_green": "ff00ff00",
-            "sink_red": "ff0000ff",
-        }
-
-        thermals = detect_thermals(details)
-        climb_blocks = [b for b in details if b['tyype'] == 'Climb']
-
-        block_index = 0
-        coordinates = []
-        for i, coord in enumerate(lon_lat_alt_list):
-            alti = coord[2]
-            block = find_block_for_altitude(coord, climb_blocks)
-            if block:
-                if alti >= alt_thresholds['orange']:
-                    color = "climb_red"
-                elif alti >= alt_thresholds['yellow']:
-                    color = "climb_orange"
-                elif alti >= alt_thresholds['green']:
-                    color = "climb_yellow"
-                else:
-                    color = "climb_green"
-            else:
-                block = find_block_for_altitude(coord, [b for b in details if b['tyype'] == 'Sink'])
-                if block:
-                    color = "sink_red"
-                else:
-                    if alti >= alt_thresholds['orange']:
-                        color = "climb_red"
-                    elif alti >= alt_thresholds['yellow']:
-                        color = "climb_orange"
-                    elif alti >= alt_thresholds['green']:
-                        color = "climb_yellow"
-                    else:
-                        color = "glide_green"
-            coordinates.append((coord[0], coord[1], coord[2], color))
-
-        f = open(out_file, "w", encoding="utf-8")
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write('<kml xmlns="http://www.opengis.net/kml/2.2"\n')
-        f.write('     xmlns:gx="http://www.google.com/kml/ext/2.2">\n')
-        f.write('<Document>\n')
-        f.write(f'<name>{kml_data["pilot"]} - Flight Analysis</name>\n')
-        f.write('<description>Flight path colored by phase: Green=Glide, Yellow/Orange=Climb, Red=Sink</description>\n')
-
-        f.write('<Style id="takeoffIcon">\n')
-        f.write('<IconStyle><color>ff00ff00</color><scale>1.5</scale>')
-        f.write('<Icon><href>http://maps.google.com/mapfiles/kml/paddle/grn-circle.png</href></Icon></IconStyle>\n')
-        f.write('</Style>\n')
-
-        f.write('<Style id="landingIcon">\n')
-        f.write('<IconStyle><color>ffff0000</color><scale>1.5</scale>')
-        f.write('<Icon><href>http://maps.google.com/mapfiles/kml/paddle/red-circle.png</href></Icon></IconStyle>\n')
-        f.write('</Style>\n')
-
-        f.write('<Style id="thermalIcon">\n')
-        f.write('<IconStyle><color>ff0080ff</color><scale>1.2</scale>')
-        f.write('<Icon><href>http://maps.google.com/mapfiles/kml/shapes/circle.png</href></Icon></IconStyle>\n')
-        f.write('</Style>\n')
-
-
-        for i, thermal in enumerate(thermals, 1):
-            f.write('<Placemark>\n')
-            f.write(f'<name>Thermal #{i} - {thermal["strength"]:.1f} m/s</name>\n')
-            f.write(f'<description>Strength: {thermal["strength"]:.1f} m/s, Alt: {thermal["alt_start"]}-{thermal["alt_end"]}m</description>\n')
-            f.write('<styleUrl>#thermalIcon</styleUrl>\n')
-            f.write('<Point>\n')
-            f.write(f'<coordinates>{thermal["lon"]},{thermal["lat"]},0</coordinates>\n')
-            f.write('</Point>\n')
-            f.write('</Placemark>\n')
-
-        if takeoff_gps:
-            f.write('<Placemark>\n')
-            f.write('<name>Takeoff</name>\n')
-            f.write('<description>Flight departure point</description>\n')
-            f.write('<styleUrl>#takeoffIcon</styleUrl>\n')
-            f.write('<Point>\n')
-            f.write(f'<coordinates>{takeoff_gps[1]},{takeoff_gps[0]},0</coordinates>\n')
-            f.write('</Point>\n')
-            f.write('</Placemark>\n')
-
-        if landing_gps:
-            f.write('<Placemark>\n')
-            f.write('<name>Landing</name>\n')
-            f.write('<description>Flight arrival point</description>\n')
-            f.write('<styleUrl>#landingIcon</styleUrl>\n')
-            f.write('<Point>\n')
-            f.write(f'<coordinates>{landing_gps[1]},{landing_gps[0]},0</coordinates>\n')
-            f.write('</Point>\n')
-            f.write('</Placemark>\n')
-
-        segment_count = 0
-        block = []
-        last_color = coordinates[0][3] if coordinates else "glide_green"
-        for i, coord in enumerate(coordinates):
-            current_color = coord[3]
-            if current_color == last_color:
-                block.append(f"{coord[0]},{coord[1]},{coord[2]}")
-            else:
-                if block:
-                    segment_count += 1
-                    f.write(f'<Placemark id="segment_{segment_count}">\n')
-                    f.write(f'<name>{get_color_name(last_color)}</name>\n')
-                    f.write('<Snippet maxLines="0"></Snippet>\n')
-                    f.write('<Style>\n')
-                    f.write('<LineStyle>\n')
-                    f.write(f'<color>{colors.get(last_color, "ff00ff00")}</color>\n')
-                    f.write('<width>4</width>\n')
-                    f.write('</LineStyle>\n')
-                    f.write('</Style>\n')
-                    f.write('<LineString>\n')
-                    f.write('<extrude>0</extrude>\n')
-                    f.write('<tessellate>1</tessellate>\n')
-                    f.write('<altitudeMode>absolute</altitudeMode>\n')
-                    f.write('<coordinates>\n')
-                    f.write(' '.join(block) + '\n')
-                    f.write('</coordinates>\n')
-                    f.write('</LineString>\n')
-                    f.write('</Placemark>\n')
-                last_color = current_color
-                block = [f"{coord[0]},{coord[1]},{coord[2]}"]
-
-        if block:
-            segment_count += 1
-            f.write(f'<Placemark id="segment_{segment_count}">\n')
-            f.write(f'<name>{get_color_name(last_color)}</name>\n')
-            f.write('<Snippet maxLines="0"></Snippet>\n')
-            f.write('<Style>\n')
-            f.write('<LineStyle>\n')
-            f.write(f'<color>{colors.get(last_color, "ff00ff00")}</color>\n')
-            f.write('<width>4</width>\n')
-            f.write('</LineStyle>\n')
-            f.write('</Style>\n')
-            f.write('<LineString>\n')
-            f.write('<extrude>0</extrude>\n')
-            f.write('<tessellate>1</tessellate>\n')
-            f.write('<altitudeMode>absolute</altitudeMode>\n')
-            f.write('<coordinates>\n')
-            f.write(' '.join(block) + '\n')
-            f.write('</coordinates>\n')
-            f.write('</LineString>\n')
-            f.write('</Placemark>\n')
-
-        f.write('<Folder>\n')
-        f.write('<name>Legend</name>\n')
-        f.write('<description>Altitude quantile color legend</description>\n')
-        f.write(f'<Placemark><name>Green - Lower 25%</name><description>Altitude below {q1}m (25th percentile)</description></Placemark>\n')
-        f.write(f'<Placemark><name>Yellow - 25-50%</name><description>Altitude {q1}-{q2}m (25th-50th percentile)</description></Placemark>\n')
-        f.write(f'<Placemark><name>Orange - 50-75%</name><description>Altitude {q2}-{q3}m (50th-75th percentile)</description></Placemark>\n')
-        f.write(f'<Placemark><name>Red - Top 25%</name><description>Altitude above {q3}m (75th-100th percentile)</description></Placemark>\n')
-        f.write('</Folder>\n')
-        f.write('</Document>\n')
-        f.write('</kml>\n')
-        f.close()
-    except Exception as e:
+def kml_thresholds(altitudes):
+    # altitude quartile thresholds of the track (None without positive altitudes)
+    sorted_altis = sorted(a for a in altitudes if a > 0)
+    if not sorted_altis:
+        return None
+    n = len(sorted_altis)
+    return {
+        'green': sorted_altis[int(n * 0.25)],
+        'yellow': sorted_altis[int(n * 0.50)],
+        'orange': sorted_altis[int(n * 0.75)]
+    }
+
+
+def kml_styles():
+    head = ['<Style id="takeoffIcon">\n',
+            '<IconStyle><color>ff00ff00</color><scale>1.5</scale>',
+            '<Icon><href>http://maps.google.com/mapfiles/kml/paddle/grn-circle.png</href></Icon></IconStyle>\n',
+            '</Style>\n',
+            '<Style id="landingIcon">\n',
+            '<IconStyle><color>ffff0000</color><scale>1.5</scale>',
+            '<Icon><href>http://maps.google.com/mapfiles/kml/paddle/red-circle.png</href></Icon></IconStyle>\n',
+            '</Style>\n',
+            '<Style id="thermalIcon">\n',
+            '<IconStyle><color>ff0080ff</color><scale>1.2</scale>',
+            '<Icon><href>http://maps.google.com/mapfiles/kml/shapes/circle.png</href></Icon></IconStyle>\n',
+            '</Style>\n']
+    for name, color in SEGMENT_COLORS.items():  # one line style per segment color
+        head.append(f'<Style id="{name}"><LineStyle><color>{color}</color><width>4</width></LineStyle></Style>\n')
+    return "".join(head)
+
+
+def kml_markers(kml_data, fmt=str):
+    # thermal, takeoff & landing placemarks
+    marks = []
+    for i, thermal in enumerate(detect_thermals(kml_data.get("details", [])), 1):
+        marks.append('<Placemark>\n'
+                     f'<name>Thermal #{i} - {thermal["strength"]:.1f} m/s</name>\n'
+                     f'<description>Strength: {thermal["strength"]:.1f} m/s, Alt: {thermal["alt_start"]}-{thermal["alt_end"]}m</description>\n'
+                     '<styleUrl>#thermalIcon</styleUrl>\n'
+                     f'<Point>\n<coordinates>{fmt(thermal["lon"])},{fmt(thermal["lat"])},0</coordinates>\n</Point>\n'
+                     '</Placemark>\n')
+
+    for gps, name, description, style in ((kml_data.get("takeoff_gps"), "Takeoff", "Flight departure point", "takeoffIcon"),
+                                          (kml_data.get("landing_gps"), "Landing", "Flight arrival point", "landingIcon")):
+        if gps:
+            marks.append('<Placemark>\n'
+                         f'<name>{name}</name>\n'
+                         f'<description>{description}</description>\n'
+                         f'<styleUrl>#{style}</styleUrl>\n'
+                         f'<Point>\n<coordinates>{fmt(gps[1])},{fmt(gps[0])},0</coordinates>\n</Point>\n'
+                         '</Placemark>\n')
+    return "".join(marks)
+
+
+def iter_colored_blocks(kml_data, track, alt_thresholds, times=False):
+    # (color, [(lon, lat, alt)...], [datetime or None...]) per run of same-color fixes
+    fix_times = iter_fix_times(track.column("time")) if times else repeat(None)
+    block = []
+    stamps = []
+    last_color = None
+    for coord, tyype, stamp in zip(track_points(kml_data, track), iter_fix_tyypes(kml_data.get("details", [])),
+                                   fix_times):
+        if tyype == 'Climb':
+            color = altitude_color(coord[2], alt_thresholds, "climb_green")
+        elif tyype == 'Sink':
+            color = "sink_red"
+        else:
+            color = altitude_color(coord[2], alt_thresholds, "glide_green")
+        if color != last_color and block:
+            yield last_color, block, stamps
+            block = []
+            stamps = []
+        last_color = color
+        block.append(coord)
+        stamps.append(stamp)
+    if block:
+        yield last_color, block, stamps
+
+
+def iter_kml(kml_data, decimals=None, tolerance_m=None, stats=None, animate=False, step_s=None):
+    # kml document as a few large text chunks: one per section & per colored track segment;
+    # decimals trims coordinates (None: full precision), styles are shared & referenced by styleUrl.
+    # Each colored segment is simplified on its own to within tolerance_m (None/0: every fix), so
+    # phase & color boundaries stay where they are; stats (a dict) gets the point counts.
+    # animate: segments are timestamped gx:Tracks instead (Google Earth time slider), with at most
+    # one fix per step_s seconds; needs the FlightTrack
+    fmt = str if decimals is None else (lambda x: str(round(x, decimals)))
+
+    track = time_ordered_track(kml_data)
+    animate = animate and track is not None
+    alt_thresholds = kml_thresholds(int(x[2]) for x in track_points(kml_data, track))
+    if alt_thresholds is None:
         return
+    q1, q2, q3 = alt_thresholds['green'], alt_thresholds['yellow'], alt_thresholds['orange']
+
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"\n'
+           '     xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+           '<Document>\n'
+           f'<name>{kml_data["pilot"]} - Flight Analysis</name>\n'
+           '<description>Flight path colored by phase: Green=Glide, Yellow/Orange=Climb, Red=Sink</description>\n'
+           + kml_styles())
+    yield kml_markers(kml_data, fmt)
+
+    blocks = iter_colored_blocks(kml_data, track, alt_thresholds, times=animate)
+    for number, (color, block, stamps) in enumerate(blocks, 1):
+        if animate:
+            yield kml_track_segment(number, color, block, stamps, fmt, step_s, stats)
+        else:
+            yield kml_segment(number, color, block, fmt, tolerance_m, stats)
+    if stats is not None and stats.get("kept"):
+        stats["ratio"] = round(stats["points"] / stats["kept"], 2)
+
+    yield ('<Folder>\n'
+           '<name>Legend</name>\n'
+           '<description>Altitude quantile color legend</description>\n'
+           f'<Placemark><name>Green - Lower 25%</name><description>Altitude below {q1}m (25th percentile)</description></Placemark>\n'
+           f'<Placemark><name>Yellow - 25-50%</name><description>Altitude {q1}-{q2}m (25th-50th percentile)</description></Placemark>\n'
+           f'<Placemark><name>Orange - 50-75%</name><description>Altitude {q2}-{q3}m (50th-75th percentile)</description></Placemark>\n'
+           f'<Placemark><name>Red - Top 25%</name><description>Altitude above {q3}m (75th-100th percentile)</description></Placemark>\n'
+           '</Folder>\n'
+           '</Document>\n'
+           '</kml>\n')
+
+
+def kml_segment(number, color, block, fmt, tolerance_m=None, stats=None):
+    kept = simplify_indices(block, tolerance_m)
+    if stats is not None:
+        stats["points"] = stats.get("points", 0) + len(block)
+        stats["kept"] = stats.get("kept", 0) + len(kept)
+    coords = [f"{fmt(block[i][0])},{fmt(block[i][1])},{block[i][2]}" for i in kept]
+    return (f'<Placemark id="segment_{number}">\n'
+            f'<name>{get_color_name(color)}</name>\n'
+            '<Snippet maxLines="0"></Snippet>\n'
+            f'<styleUrl>#{color}</styleUrl>\n'
+            '<LineString>\n'
+            '<extrude>0</extrude>\n'
+            '<tessellate>1</tessellate>\n'
+            '<altitudeMode>absolute</altitudeMode>\n'
+            '<coordinates>\n'
+            f'{" ".join(coords)}\n'
+            '</coordinates>\n'
+            '</LineString>\n'
+            '</Placemark>\n')
+
+
+def kml_track_segment(number, color, block, stamps, fmt, step_s=None, stats=None):
+    # one colored segment as a gx:Track: all <when>s, then the matching <gx:coord>s
+    kept = decimate_indices(stamps, step_s)
+    if stats is not None:
+        stats["points"] = stats.get("points", 0) + len(block)
+        stats["kept"] = stats.get("kept", 0) + len(kept)
+    whens = [f"<when>{stamps[i].isoformat()}Z</when>" for i in kept]
+    coords = [f"<gx:coord>{fmt(block[i][0])} {fmt(block[i][1])} {block[i][2]}</gx:coord>" for i in kept]
+    return (f'<Placemark id="segment_{number}">\n'
+            f'<name>{get_color_name(color)}</name>\n'
+            '<Snippet maxLines="0"></Snippet>\n'
+            f'<styleUrl>#{color}</styleUrl>\n'
+            '<gx:Track>\n'
+            '<altitudeMode>absolute</altitudeMode>\n'
+            f'{"".join(whens)}\n'
+            f'{"".join(coords)}\n'
+            '</gx:Track>\n'
+            '</Placemark>\n')
+
+
+def kml_options(decimals=None, tolerance_m=None, step_s=None):
+    # the output options of create_enhanced_kml() & co, None taking the settings default
+    return (settings["kml_decimals"] if decimals is None else decimals,
+            settings["kml_tolerance_m"] if tolerance_m is None else tolerance_m,
+            settings["kml_track_step_s"] if step_s is None else step_s)
+
+
+def write_kml(kml_data, out_file, decimals=None, tolerance_m=None, stats=None, animate=False, step_s=None,
+              kmz=None):
+    # out_file: path (zipped when it ends in .kmz) or a binary file object (zipped unless kmz=False)
+    is_path = isinstance(out_file, (str, os.PathLike))
+    if kmz is None:
+        kmz = os.fspath(out_file).lower().endswith(".kmz") if is_path else True
+    chunks = iter_kml(kml_data, decimals, tolerance_m, stats, animate, step_s)
+    first = next(chunks, None)
+    if first is None:  # no track to draw
+        return None
+    if kmz:
+        with zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as archive:
+            with archive.open("doc.kml", "w") as entry, io.TextIOWrapper(entry, encoding="utf-8") as f:
+                f.write(first)
+                f.writelines(chunks)
+    elif is_path:
+        with open(out_file, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+            f.write(first)
+            f.writelines(chunks)
+    else:
+        f = io.TextIOWrapper(out_file, encoding="utf-8", write_through=True)
+        f.write(first)
+        f.writelines(chunks)
+        f.detach()  # leave out_file open for the caller
+    return out_file
+
+
+@timed("kml", lambda kml_data, *args: kml_data.get("timings"))
+def create_enhanced_kml(kml_data, decimals=None, tolerance_m=None, stats=None, animate=False, step_s=None):
+    # <igc name>.kml next to the IGC file (path returned, None if there is no track; errors raise);
+    # animate=True writes the time-animated gx:Track version
+    decimals, tolerance_m, step_s = kml_options(decimals, tolerance_m, step_s)
+    out_file = f"{kml_data['filename'].rsplit('.', 1)[0]}.kml"
+    if os.path.exists(out_file):
+        os.remove(out_file)
+    return write_kml(kml_data, out_file, decimals, tolerance_m, stats, animate, step_s)
+
+
+@timed("kmz", lambda kml_data, *args: kml_data.get("timings"))
+def create_enhanced_kmz(kml_data, decimals=None, tolerance_m=None, stats=None, animate=False, step_s=None):
+    # same document zipped as <igc name>.kmz (doc.kml inside), what the bot attaches to replies
+    decimals, tolerance_m, step_s = kml_options(decimals, tolerance_m, step_s)
+    out_file = f"{kml_data['filename'].rsplit('.', 1)[0]}.kmz"
+    if os.path.exists(out_file):
+        os.remove(out_file)
+    return write_kml(kml_data, out_file, decimals, tolerance_m, stats, animate, step_s)
+
+
+@timed("kmz", lambda kml_data, *args: kml_data.get("timings"))
+def kmz_bytes(kml_data, decimals=None, tolerance_m=None, stats=None, animate=False, step_s=None):
+    # the create_enhanced_kmz() document in memory, nothing written to disk (None if there is no track)
+    decimals, tolerance_m, step_s = kml_options(decimals, tolerance_m, step_s)
+    buffer = io.BytesIO()
+    if write_kml(kml_data, buffer, decimals, tolerance_m, stats, animate, step_s) is None:
+        return
+    return buffer.getvalue()
+
+
+def combine_kmz(flights, name="Flights"):
+    # one kmz for several flights: flights is [(igc name, kmz bytes)]; each flight's doc.kml is kept
+    # as files/<n>-<name>.kml inside the archive & loaded by a NetworkLink from the top doc.kml
+    # (written first: Google Earth opens the first kml in a kmz)
+    if len(flights) == 1:
+        return flights[0][1]
+    hrefs, links = [], []
+    for number, (igc_name, _) in enumerate(flights, 1):
+        stem = os.path.splitext(os.path.basename(igc_name))[0]
+        hrefs.append(f"files/{number:02d}-{stem}.kml")
+        links.append(f'<NetworkLink><name>{escape(stem)}</name>'
+                     f'<Link><href>{escape(hrefs[-1])}</href></Link></NetworkLink>\n')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("doc.kml", '<?xml version="1.0" encoding="UTF-8"?>\n'
+                                    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+                                    f'<Document>\n<name>{escape(name)}</name>\n' + "".join(links)
+                         + '</Document>\n</kml>\n')
+        for href, (_, kmz) in zip(hrefs, flights):
+            with zipfile.ZipFile(io.BytesIO(kmz)) as flight:
+                archive.writestr(href, flight.read("doc.kml"))
+    return buffer.getvalue()
@@ -0,0 +1,152 @@
+# Outbound Mail: queued sending over one kept-alive SMTP session
+import queue
+import smtplib
+import threading
+import time
+
+
+class MessageError(smtplib.SMTPException):
+    """ A message that could not be sent as it is (e.g. a header that does not serialize); the original
+    error is its __cause__. """
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def is_permanent(error):
+    # 5xx answers, refused recipients & unsendable messages will fail the same way again; disconnects &
+    # 4xx are retried
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, MessageError)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+# Core Functions ---------------------------------------------------------------------------|
+class Outbox:
+    """ Sends queued messages in batches over one logged-in SMTP session.
+
+    put() queues a message (on_done(error) is called once it was sent, error None, or given up on);
+    send() queues one and waits for it. A background thread takes up to batch_size queued messages at
+    a time and sends them back to back on the same session, reconnecting after a failure and retrying
+    with backoff. The session is closed after idle_close seconds without mail, before the server
+    drops it. metrics() gives queue depth, send latency (queued -> accepted) and counters.
+    """
+
+    def __init__(self, server, port=587, user=None, password=None, starttls=True, batch_size=20, retries=4,
+                 max_backoff=60.0, idle_close=60.0):
+        self.server, self.port = server, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.batch_size = batch_size
+        self.retries = retries
+        self.max_backoff = max_backoff
+        self.idle_close = idle_close
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "connects": 0, "batches": 0,
+                      "last_latency_s": None, "max_latency_s": 0.0, "total_latency_s": 0.0}
+        self._queue = queue.Queue()
+        self._smtp = None
+        threading.Thread(target=self._run, name="outbox", daemon=True).start()
+
+    # Queueing ----------------------------------------------------------------------------|
+    def put(self, msg, on_done=None):
+        self._queue.put((msg, on_done, time.monotonic()))
+
+    def send(self, msg, timeout=None):
+        # queue msg & wait until it was sent; raises the final error if it could not be
+        finished = threading.Event()
+        outcome = {}
+
+        def on_done(error):
+            outcome["error"] = error
+            finished.set()
+
+        self.put(msg, on_done)
+        if not finished.wait(timeout):
+            raise TimeoutError("message still queued")
+        if outcome["error"] is not None:
+            raise outcome["error"]
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        stats = dict(self.stats)
+        stats["queue_depth"] = self.queue_depth()
+        stats["avg_latency_s"] = round(stats.pop("total_latency_s") / stats["sent"], 3) if stats["sent"] else None
+        return stats
+
+    # Session -----------------------------------------------------------------------------|
+    def _session(self):
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.server, self.port, timeout=60)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.user:
+                    smtp.login(self.user, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self.stats["connects"] += 1
+        return self._smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    # Sending -----------------------------------------------------------------------------|
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_close)]
+            except queue.Empty:
+                self._close()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.stats["batches"] += 1
+            for msg, on_done, queued_at in batch:
+                error = self._deliver(msg)
+                latency = time.monotonic() - queued_at
+                if error is None:
+                    self.stats["sent"] += 1
+                    self.stats["last_latency_s"] = round(latency, 3)
+                    self.stats["max_latency_s"] = max(self.stats["max_latency_s"], round(latency, 3))
+                    self.stats["total_latency_s"] += latency
+                else:
+                    self.stats["failed"] += 1
+                if on_done is not None:
+                    try:
+                        on_done(error)
+                    except Exception as e:
+                        print(f"Outbox callback error: {e}")
+
+    def _deliver(self, msg):
+        # None once the server accepted msg, else the last error
+        backoff = 0.0  # the first retry reconnects right away (the session had just gone stale)
+        for attempt in range(self.retries + 1):
+            try:
+                self._session().send_message(msg)
+                return None
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+                if is_permanent(e):  # the session itself is fine
+                    break
+                self._close()
+                if attempt == self.retries:
+                    break
+                self.stats["retries"] += 1
+                time.sleep(backoff)
+                backoff = min(max(backoff * 2, 1.0), self.max_backoff)
+            except Exception as e:  # not an SMTP failure: this message is given up on, the thread keeps sending
+                self._close()  # it may have stopped mid-transaction
+                error = MessageError(f"could not send the message: {e!r}")
+                error.__cause__ = e
+                break
+        return error
@@ -0,0 +1,105 @@
+# Reply Cache: recently answered IGC uploads, so forwarded / CC'd copies are answered without analysis
+import hashlib
+import json
+import os
+import pickle
+import time
+import zlib
+from pathlib import Path
+
+from base import settings
+
+# Constants -------------------------------------/
+REPLY_CACHE_DIR = Path(os.getenv("REPLY_CACHE_DIR", Path(__file__).parent.parent / "Log" / ".replies"))
+REPLY_CACHE_WINDOW_S = int(os.getenv("REPLY_CACHE_WINDOW_S", str(7 * 24 * 3600)))  # 0 disables the cache
+REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "500"))
+REPLY_CACHE_MAX_BYTES = int(os.getenv("REPLY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+REPLY_VERSION = 2  # bump when the report or kmz output changes
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def fingerprint(igc_bytes):
+    # content hash with CRLF / CR line endings and trailing blank lines normalized away, so a copy
+    # that went through a different mail client still matches
+    normalized = igc_bytes.replace(b"\r\n", b"\n").replace(b"\r", b"\n").rstrip(b"\n")
+    digest = hashlib.sha256(normalized)
+    digest.update(json.dumps({"version": REPLY_VERSION, "settings": settings}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _entry_path(fp):
+    return REPLY_CACHE_DIR / f"{fp}.bin"
+
+
+def _read_entry(path):
+    with open(path, "rb") as f:
+        return pickle.loads(zlib.decompress(f.read()))
+
+
+def _write_entry(path, entry):
+    REPLY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")  # workers may store at the same time
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), 6))
+    os.replace(tmp, path)
+
+
+def evict(window_s=None, max_entries=None, max_bytes=None):
+    # entries older than the window go first, then the oldest until both limits hold
+    window_s = REPLY_CACHE_WINDOW_S if window_s is None else window_s
+    max_entries = REPLY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = REPLY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    cutoff = time.time() - window_s
+    entries = []
+    for path in REPLY_CACHE_DIR.glob("*.bin"):
+        try:
+            st = path.stat()
+        except FileNotFoundError:  # evicted by another worker
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    count = len(entries)
+    for mtime, size, path in entries:
+        if mtime >= cutoff and count <= max_entries and total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        count -= 1
+
+
+def clear():
+    for path in REPLY_CACHE_DIR.glob("*.bin"):
+        path.unlink(missing_ok=True)
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def lookup(fp):
+    # the stored reply parts for fingerprint fp, None if unseen or older than the window
+    if REPLY_CACHE_WINDOW_S <= 0:
+        return None
+    path = _entry_path(fp)
+    try:
+        entry = _read_entry(path)
+    except FileNotFoundError:
+        return None
+    except Exception:  # unreadable: dropped, the upload is analyzed again
+        path.unlink(missing_ok=True)
+        return None
+    if time.time() - entry["stored_at"] > REPLY_CACHE_WINDOW_S:
+        path.unlink(missing_ok=True)
+        return None
+    return entry
+
+
+def store(fp, report, kmz=None, filename=None):
+    # keep the formatted report (display.build_report() model, ready to render) and kmz bytes of
+    # one answered upload
+    if REPLY_CACHE_WINDOW_S <= 0:
+        return
+    entry = {"report": report, "kmz": kmz, "filename": filename, "stored_at": time.time()}
+    try:
+        _write_entry(_entry_path(fp), entry)
+        evict()
+    except OSError as e:  # the reply still goes out, only later copies are analyzed again
+        print(f"Reply cache error: {e}")
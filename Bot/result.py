@@ -0,0 +1,197 @@
+# Lazy Flight Results
+from collections.abc import MutableMapping
+
+import timing
+from base import format_timestamp, haversine
+from decode import parse_igc, scan_flight, read_source, source_name, flight_analyzer, analyze_glide_performance, \
+    analyze_thermals
+
+
+class FlightResult(MutableMapping):
+    """ The load_igc() results dictionary, computed on first access.
+
+    Header & takeoff/landing keys only need a light scan of the file, per-fix statistics need the full
+    parse, grades & details need flight_analyzer(), and glide_perf / thermals / kml_data / model_data
+    are derived from those. Each part is computed once and kept; assigned keys (e.g. 'timings') are
+    stored as in a dict.
+    """
+
+    def __init__(self, in_igc_file, flight=None, track=None, analysis=None, timings=None, name=None):
+        self.filename = source_name(in_igc_file, name)
+        self._source = read_source(in_igc_file) if flight is None else None  # path, bytes or lines
+        self._flight = flight  # parse_igc() flight dict (None: not parsed yet)
+        self._track = track
+        self._analysis = analysis
+        self._summary = flight  # takeoff/landing fields, from the parse or from scan_flight()
+        self._values = {}
+        if timings is None and timing.enabled:
+            timings = {}
+        if timings is not None:
+            self._values["timings"] = timings
+        if self._summary is None:
+            with timing.stage("scan", timings):
+                self._summary = scan_flight(self._source)
+        if self._summary["takeoff_dt"] is None:
+            raise ValueError(f"No takeoff detected in {self.filename}")
+
+    # Parts ------------------------------------------------------------------------------|
+    @property
+    def timings(self):
+        return self._values.get("timings")
+
+    @property
+    def flight(self):
+        if self._flight is None:
+            with timing.stage("parse", self.timings):
+                self._flight, self._track = parse_igc(self._source)
+            self._summary = self._flight
+        return self._flight
+
+    @property
+    def track(self):
+        if self._track is None:
+            self.flight
+        return self._track
+
+    @property
+    def analysis(self):
+        if self._analysis is None:
+            flight, track = self.flight, self.track
+            with timing.collect(self.timings):  # segment & grade stages
+                self._analysis = flight_analyzer(track, flight["flight_area_km"])
+        return self._analysis
+
+    @property
+    def fixes(self):
+        # B-Record count, from the scan while the file is not parsed
+        if self._track is None and "fixes" in self._summary:
+            return self._summary["fixes"]
+        return len(self.track)
+
+    @property
+    def duration(self):
+        duration = (self._summary["landing_dt"] - self._summary["takeoff_dt"]).total_seconds()
+        if duration < 0:
+            duration = duration + (24 * 60 * 60)
+        return duration
+
+    def takeoff_to_land_dist(self):
+        s = self._summary
+        return haversine((s["takeoff_lat"], s["takeoff_lon"]), (s["landing_lat"], s["landing_lon"]))
+
+    def gps(self, side):
+        return round(self._summary[f"{side}_lat"], 5), round(self._summary[f"{side}_lon"], 5)
+
+    def model_data(self):
+        # Weather Model Data
+        s, flight = self._summary, self.flight
+        return {"takeoff_datetime": s["takeoff_dt"],
+                "landing_datetime": s["landing_dt"],
+                "duration": self.duration,
+                "takeoff_gps": (s["takeoff_lat"], s["takeoff_lon"]),
+                "landing_gps": (s["landing_lat"], s["landing_lon"]),
+                "max_altitude": flight["high_alt_m"],
+                "distance_total": flight["total_distance_km"],
+                "takeoff_to_landing": self.takeoff_to_land_dist(),
+                "flight_area": flight["flight_area_km"]}
+
+    def glide_perf(self):
+        with timing.stage("glide_perf", self.timings):
+            return analyze_glide_performance(self.analysis["details"], self._summary["glider"])
+
+    def thermals(self):
+        if self.analysis["flight_type"] == "soaring":
+            return None
+        with timing.stage("thermals", self.timings):
+            return analyze_thermals(self.analysis["details"])
+
+    def kml_data(self):
+        kml_data = {"pilot": self._summary["pilot"],
+                    "filename": self.filename,
+                    "takeoff_gps": self.gps("takeoff"),
+                    "landing_gps": self.gps("landing"),
+                    "track": self.track,
+                    "details": self.analysis["details"]}
+        if self.timings is not None:
+            kml_data["timings"] = self.timings  # kml writing is timed later, into the same section
+        return kml_data
+
+    # Mapping protocol -------------------------------------------------------------------|
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key not in RESULT_KEYS:
+            raise KeyError(key)
+        value = self._values[key] = RESULT_KEYS[key](self)
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._values[key]
+
+    def __iter__(self):
+        yield from RESULT_KEYS
+        yield from (key for key in self._values if key not in RESULT_KEYS)
+
+    def __len__(self):
+        return len(RESULT_KEYS) + sum(1 for key in self._values if key not in RESULT_KEYS)
+
+    def __contains__(self, key):
+        return key in RESULT_KEYS or key in self._values
+
+    def __repr__(self):
+        return f"FlightResult({self.filename!r}, computed={sorted(self._values)})"
+
+    def to_dict(self):
+        return dict(self)
+
+
+# Result key -> how to compute it (in the order the results dictionary always had) ----------/
+RESULT_KEYS = {
+    "filename": lambda r: r.filename,
+    "pilot": lambda r: r._summary["pilot"],
+    "vario": lambda r: r._summary["vario"],
+    "glider": lambda r: r._summary["glider"],
+    "flight_date": lambda r: r._summary["takeoff_dt"],
+    "max_alt": lambda r: r.flight["high_alt_m"],
+    "max_lift": lambda r: r.flight["high_lift_m"],
+    "max_sink": lambda r: r.flight["high_sink_m"],
+    "takeoff_datetime": lambda r: format_timestamp(r._summary["takeoff_dt"]),
+    "takeoff_alt": lambda r: r._summary["takeoff_alt_m"],
+    "takeoff_gps": lambda r: r.gps("takeoff"),
+    "takeoff_heading": lambda r: r._summary["takeoff_heading"],
+    "landing_datetime": lambda r: format_timestamp(r._summary["landing_dt"]),
+    "landing_alt": lambda r: r._summary["landing_alt_m"],
+    "landing_gps": lambda r: r.gps("landing"),
+    "landing_heading": lambda r: r._summary["landing_heading"],
+    "total_distance": lambda r: round(r.flight["total_distance_km"], 1),
+    "takeoff_to_land_dist": lambda r: round(r.takeoff_to_land_dist(), 1),
+    "flight_area_diameter": lambda r: round(r.flight["flight_area_km"], 2),
+    "duration": lambda r: r.duration,
+    # Analysis Data
+    "flight_type": lambda r: r.analysis["flight_type"],
+    "climbs_num": lambda r: r.analysis["climbs_num"],
+    "glides_num": lambda r: r.analysis["glides_num"],
+    "sinks_num": lambda r: r.analysis["sinks_num"],
+    "climb_grade": lambda r: r.analysis["climb_grade"],
+    "max_sustained_climb": lambda r: r.analysis["max_sustained_climb"],
+    "glide_grade": lambda r: r.analysis["glide_grade"],
+    "sink_grade": lambda r: r.analysis["sink_grade"],
+    "details": lambda r: r.analysis["details"],
+    "µ_sustained_climb": lambda r: r.analysis["µ_sustained_climb"],
+    "µ_sustained_glide": lambda r: r.analysis["µ_sustained_glide"],
+    "model_data": FlightResult.model_data,
+    "track": lambda r: r.track,
+    # Glide, Thermal & kml Data
+    "glide_perf": FlightResult.glide_perf,
+    "thermals": FlightResult.thermals,
+    "kml_data": FlightResult.kml_data,
+}
+# keys answered by scan_flight() alone, without the full parse
+SCAN_KEYS = {"filename", "pilot", "vario", "glider", "flight_date", "takeoff_datetime", "takeoff_alt", "takeoff_gps",
+             "takeoff_heading", "landing_datetime", "landing_alt", "landing_gps", "landing_heading",
+             "takeoff_to_land_dist", "duration"}
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# Synthetic IGC Generator: deterministic flights for benchmarks & checks
+import argparse
+import math
+import random
+
+# Header variants (as the parser sees them) -------------------------------------/
+HEADERS = {
+    "xctracer": ["AXCT3d8b6c9e",
+                 "HFDTE{date}",
+                 "HFPLTPILOT:{pilot}",
+                 "HFGTYGLIDERTYPE:{glider}",
+                 "HFFTYFRTYPE:XCTracer,Maxx II"],
+    "flymaster": ["AXFMLIVESD",
+                  "HFDTE{date}",
+                  "HFPLTPILOTINCHARGE:{pilot}",
+                  "HFGTYGLIDERTYPE:{glider}",
+                  "HFFTYFRTYPE:Flymaster,LiveSD",
+                  "HFGPS:uBLOX NEO-M8"],
+    "seeyou": ["AXSYNavigator",
+               "HFDTEDATE:{date},01",
+               "HFPLTPILOTINCHARGE:{pilot}",
+               "HFGTYGLIDERTYPE:{glider}",
+               "HFFTYFRTYPE:Naviter,SeeYou Navigator"],
+}
+METERS_PER_DEG = 111195.0
+GROUND_SECS = 60  # stationary fixes before launch & after landing
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+def format_b_record(secs, lat, lon, alt_m):
+    hh, mm, ss = (secs // 3600) % 24, (secs // 60) % 60, secs % 60
+    lat_min, lon_min = round(abs(lat) * 60000), round(abs(lon) * 60000)
+    alt = f"{max(0, min(99999, round(alt_m))):05d}"
+    return (f"B{hh:02d}{mm:02d}{ss:02d}"
+            f"{lat_min // 60000:02d}{lat_min % 60000:05d}{'S' if lat < 0 else 'N'}"
+            f"{lon_min // 60000:03d}{lon_min % 60000:05d}{'W' if lon < 0 else 'E'}"
+            f"A{alt}{alt}")
+
+
+def flight_phases(duration_s, thermals, rng):
+    # (phase, seconds) alternating glides & thermals, about 40% of the time spent climbing
+    if thermals <= 0:
+        return [("glide", duration_s)]
+    climb_total = duration_s * 0.4
+    weights = [rng.uniform(0.6, 1.4) for _ in range(thermals)]
+    climbs = [max(30, int(climb_total * w / sum(weights))) for w in weights]
+    glide_each = max(30, (duration_s - sum(climbs)) // (thermals + 1))
+    phases = [("glide", glide_each)]
+    for climb in climbs:
+        phases += [("thermal", climb), ("glide", glide_each)]
+    return phases
+
+
+# Core Functions ---------------------------------------------------------------------------|
+def iter_igc_lines(duration_s=3600, sample_rate_s=1, thermals=5, header="xctracer", seed=0,
+                   start=(43.894, -116.191), launch_alt_m=1600, date="280525", start_secs=10 * 3600,
+                   pilot="Test Pilot", glider="Ozone Zeno"):
+    # IGC lines (no line endings) of a launch, 'thermals' climbs linked by glides & a landing;
+    # the same arguments always give the same file
+    rng = random.Random(seed)
+    for line in HEADERS[header]:
+        yield line.format(date=date, pilot=pilot, glider=glider)
+
+    lat, lon = start
+    alt = float(launch_alt_m)
+    ground_alt = launch_alt_m - 700.0
+    course = rng.uniform(0, 360)
+    wind = (rng.uniform(-1.0, 1.0), rng.uniform(-1.0, 1.0))  # east, north m/s
+    secs = start_secs
+
+    def step(dt, speed, heading, vario):
+        nonlocal lat, lon, alt
+        north = (speed * math.cos(math.radians(heading)) + wind[1]) * dt
+        east = (speed * math.sin(math.radians(heading)) + wind[0]) * dt
+        lat += north / METERS_PER_DEG
+        lon += east / (METERS_PER_DEG * math.cos(math.radians(lat)))
+        alt = max(ground_alt + 50, alt + vario * dt)
+
+    # on launch
+    for _ in range(0, GROUND_SECS, sample_rate_s):
+        yield format_b_record(secs, lat, lon, alt + rng.choice((-1, 0, 0, 1)))
+        secs += sample_rate_s
+
+    # airborne
+    for phase, length in flight_phases(duration_s, thermals, rng):
+        strength = rng.uniform(1.5, 4.0)
+        sink = rng.uniform(0.9, 1.6) if rng.random() > 0.15 else rng.uniform(2.8, 4.0)  # some strong sink
+        heading = course
+        for _ in range(0, length, sample_rate_s):
+            if phase == "thermal":
+                heading = (heading + 360 / 24 * sample_rate_s) % 360  # ~24s per turn
+                step(sample_rate_s, 9.0, heading, strength + rng.gauss(0, 0.8))
+            else:
+                heading = course + rng.gauss(0, 4)
+                step(sample_rate_s, 11.0, heading, -sink + rng.gauss(0, 0.4))
+            yield format_b_record(secs, lat, lon, alt)
+            secs += sample_rate_s
+        course = (course + rng.uniform(-30, 30)) % 360
+
+    # landed
+    alt = ground_alt
+    for _ in range(0, GROUND_SECS, sample_rate_s):
+        yield format_b_record(secs, lat, lon, alt + rng.choice((-1, 0, 0, 1)))
+        secs += sample_rate_s
+
+
+def generate_igc(**kwargs):
+    return "\n".join(iter_igc_lines(**kwargs)) + "\n"
+
+
+def write_igc(path, **kwargs):
+    with open(path, "w") as f:
+        for line in iter_igc_lines(**kwargs):
+            f.write(line + "\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic IGC flight.")
+    parser.add_argument("output", help="IGC file to write")
+    parser.add_argument("--duration", type=int, default=3600, help="airborne seconds (default 3600)")
+    parser.add_argument("--rate", type=int, default=1, help="seconds between fixes (default 1)")
+    parser.add_argument("--thermals", type=int, default=5, help="number of thermals (default 5)")
+    parser.add_argument("--header", choices=sorted(HEADERS), default="xctracer", help="vario header variant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_igc(args.output, duration_s=args.duration, sample_rate_s=args.rate, thermals=args.thermals,
+              header=args.header, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Per-Stage Timing & Profiling (opt-in)
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Switches -------------------------------------/
+enabled = os.getenv("IGC_TIMINGS", "") not in ("", "0")
+_active = threading.local()  # the timings dict load_igc() is filling on this thread
+_NULL = nullcontext()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+# Helper Functions ---------------------------------------------------------------------------|
+@contextmanager
+def _measure(name, timings):
+    wall, cpu, blocks = time.perf_counter(), time.thread_time(), sys.getallocatedblocks()
+    try:
+        yield
+    finally:
+        entry = timings.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "alloc_blocks": 0, "calls": 0})
+        entry["wall_s"] += time.perf_counter() - wall
+        entry["cpu_s"] += time.thread_time() - cpu
+        entry["alloc_blocks"] += sys.getallocatedblocks() - blocks  # net blocks still allocated after the stage
+        entry["calls"] += 1
+
+
+def stage(name, timings=None):
+    # with stage("parse"): ... -> wall/cpu time & allocations recorded under name, in timings or else in
+    # the collect() dict of this thread; a shared no-op when disabled
+    if not enabled:
+        return _NULL
+    if timings is None:
+        timings = getattr(_active, "timings", None)
+        if timings is None:
+            return _NULL
+    return _measure(name, timings)
+
+
+def timed(name, timings_of=None):
+    # decorator form of stage(); timings_of(*args) picks the timings dict out of the arguments
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with stage(name, timings_of(*args) if timings_of else None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect(timings=None):
+    # with collect() as timings: stages on this thread record into timings (None when disabled);
+    # an existing timings dict can be passed to record more into it, nested collect() calls share the outer dict
+    if not enabled:
+        yield None
+        return
+    outer = getattr(_active, "timings", None)
+    if outer is not None:
+        yield outer
+        return
+    _active.timings = timings = {} if timings is None else timings
+    try:
+        yield timings
+    finally:
+        _active.timings = None
+
+
+@contextmanager
+def profile_to(path, top=40):
+    # cProfile everything in the block, dump path (.pstats) & a cumulative-time text summary next to it
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+        with open(os.path.splitext(path)[0] + ".txt", "w") as f:
+            f.write(text.getvalue())
@@ -0,0 +1,147 @@
+# Array-backed Flight Track
+from array import array
+
+# Column name -> array typecode -------------------------------------/
+COLUMNS = (("time", "q"),  # DDMMYYHHMMSS as in the analysis tuples
+           ("lat", "d"),
+           ("lon", "d"),
+           ("alt", "i"),  # meters
+           ("heading", "d"),  # degrees
+           ("distance", "d"))  # km from the previous fix
+
+
+class FlightTrack:
+    """ Per-fix flight data held as typed columns instead of per-fix tuples.
+
+    Indexing returns the classic analysis tuple (datetime, lat, lon, alt_m, heading, distance).
+    Slicing returns a view sharing the columns of the full track (no copy); only the full
+    track can be appended to.
+    """
+    __slots__ = ("time", "lat", "lon", "alt", "heading", "distance", "start", "stop")
+
+    def __init__(self, time=None, lat=None, lon=None, alt=None, heading=None, distance=None):
+        given = (time, lat, lon, alt, heading, distance)
+        for (name, typecode), column in zip(COLUMNS, given):
+            if not isinstance(column, array) or column.typecode != typecode:
+                column = array(typecode, column if column is not None else ())
+            setattr(self, name, column)
+        if len({len(getattr(self, name)) for name, _ in COLUMNS}) > 1:
+            raise ValueError("FlightTrack columns must have the same length")
+        self.start = 0
+        self.stop = None  # None: full track, grows with append()
+
+    @classmethod
+    def from_fixes(cls, fixes):
+        track = cls()
+        track.extend(fixes)
+        return track
+
+    def _view(self, start, stop):
+        view = object.__new__(FlightTrack)
+        for name, _ in COLUMNS:
+            setattr(view, name, getattr(self, name))
+        view.start = start
+        view.stop = stop
+        return view
+
+    def _bounds(self):
+        return self.start, len(self.time) if self.stop is None else self.stop
+
+    # Sequence protocol ------------------------------------------------------------------|
+    def __len__(self):
+        start, stop = self._bounds()
+        return stop - start
+
+    def __getitem__(self, index):
+        start, stop = self._bounds()
+        if isinstance(index, slice):
+            first, last, step = index.indices(stop - start)
+            if step != 1:
+                raise ValueError("FlightTrack views do not support a step")
+            return self._view(start + first, start + max(first, last))
+        if index < 0:
+            index += stop - start
+        if not 0 <= index < stop - start:
+            raise IndexError("FlightTrack index out of range")
+        i = start + index
+        return self.time[i], self.lat[i], self.lon[i], self.alt[i], self.heading[i], self.distance[i]
+
+    def __iter__(self):
+        return zip(*(self.column(name) for name, _ in COLUMNS))
+
+    def __eq__(self, other):
+        if not isinstance(other, FlightTrack):
+            return NotImplemented
+        return len(self) == len(other) and all(self.column(name) == other.column(name) for name, _ in COLUMNS)
+
+    def __repr__(self):
+        start, stop = self._bounds()
+        return f"FlightTrack({stop - start} fixes, [{start}:{stop}])"
+
+    def __getstate__(self):
+        # pickle only the fixes in this view
+        return {name: array(typecode, self.column(name)) for name, typecode in COLUMNS}
+
+    def __setstate__(self, state):
+        for name, _ in COLUMNS:
+            setattr(self, name, state[name])
+        self.start = 0
+        self.stop = None
+
+    # Columns ----------------------------------------------------------------------------|
+    def column(self, name):
+        # zero-copy view of one column over this track's fixes (do not append while it is held)
+        start, stop = self._bounds()
+        return memoryview(getattr(self, name))[start:stop]
+
+    def lon_lat_alt(self):
+        # (lon, lat, alt) per fix, the order kml coordinates use
+        return zip(self.column("lon"), self.column("lat"), self.column("alt"))
+
+    def append(self, fix):
+        if self.stop is not None:
+            raise ValueError("Cannot append to a FlightTrack view")
+        dt_int, lat, lon, alt_m, heading, distance = fix
+        self.time.append(dt_int)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.alt.append(alt_m)
+        self.heading.append(heading)
+        self.distance.append(distance)
+
+    def extend(self, fixes):
+        for fix in fixes:
+            self.append(fix)
+
+    def elapsed(self):
+        # seconds of day per fix, a day later each time the clock wraps past midnight (B-Records only
+        # carry the time of day); a step back of up to 12 h is an out-of-order fix, not a wrap
+        elapsed = array("q")
+        day = 0
+        last = None
+        for t in self.column("time"):
+            clock = t % 1000000
+            seconds = clock // 10000 * 3600 + clock // 100 % 100 * 60 + clock % 100 + day
+            if last is not None and seconds < last - 43200:
+                day += 86400
+                seconds += 86400
+            elapsed.append(seconds)
+            last = seconds
+        return elapsed
+
+    def is_time_ordered(self):
+        times = self.column("time")
+        if all(a <= b for a, b in zip(times, times[1:])):
+            return True
+        elapsed = self.elapsed()  # a flight past 00:00 UTC is still in order
+        return all(a <= b for a, b in zip(elapsed, elapsed[1:]))
+
+    def sorted_by_time(self):
+        # stable sort on the elapsed time into a new full track (fixes past midnight stay after the others)
+        order = sorted(range(len(self)), key=self.elapsed().__getitem__)
+        columns = [self.column(name) for name, _ in COLUMNS]
+        return FlightTrack(*([column[i] for i in order] for column in columns))
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).itemsize for name, _ in COLUMNS) * len(self)
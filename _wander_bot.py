@@ -1,14 +1,15 @@
 #!/usr/bin/python3
-import imaplib
-import smtplib
 import email
+import hashlib
 import os
-import re
 import sys
 import time
-import io
 import datetime
-from contextlib import redirect_stdout
+import queue
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -16,23 +17,45 @@ from email import encoders
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent / "Bot"))
-from decode import load_igc
-from kmls import create_enhanced_kml
-from display import display_summary_stats
+from cache import load_igc_cached
+from kmls import kmz_bytes, combine_kmz
+from display import build_report, build_day_report, flight_report, render_report
+import inbox
+from journal import Journal
+import replies
+from outbox import Outbox, is_permanent
 
 IMAP_SERVER = os.getenv("IMAP_SERVER", "mail.privateemail.com")
 IMAP_USER = os.getenv("IMAP_USER", "wanderbot@wanderexpeditions.com")
 IMAP_PASS = os.getenv("IMAP_PASS", "gufpin-syfdi5-pIzpir")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_SSL = os.getenv("IMAP_SSL", "1") != "0"  # 0: plain IMAP, e.g. a local test server
 SMTP_SERVER = os.getenv("SMTP_SERVER", IMAP_SERVER)
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"  # 0 (with SMTP_AUTH=0): a local test server
+SMTP_AUTH = os.getenv("SMTP_AUTH", "1") != "0"
+SMTP_BATCH = int(os.getenv("SMTP_BATCH", "20"))  # queued replies sent per batch on the kept-alive session
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "60"))
+MAIL_MODE = os.getenv("MAIL_MODE", "idle")  # idle: push via IMAP IDLE (falls back to poll), poll: every POLL_INTERVAL
+IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "1500"))  # re-IDLE before the server's 29 min limit
+MAX_BACKOFF = int(os.getenv("MAX_BACKOFF", "300"))  # longest wait between reconnect attempts
+WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))  # analysis/reply processes
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", str(2 * WORKERS)))  # messages queued or in progress before polling waits
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))  # failed tries before a message is given up on
+RETRY_DELAY_S = int(os.getenv("RETRY_DELAY_S", "60"))  # wait before retrying a failed job, doubled per attempt
+MAX_RETRY_DELAY_S = int(os.getenv("MAX_RETRY_DELAY_S", "3600"))
 ERROR_NOTIFY = os.getenv("ERROR_NOTIFY", "randall@wanderexpeditions.com")
 LOG_DIR = Path(__file__).parent / "Log"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LAST_REPORT_FILE = LOG_DIR / ".last_weekly_report"
+MAX_ATTACHMENTS = int(os.getenv("MAX_ATTACHMENTS", "20"))  # IGC files analyzed per message, the rest are ignored
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(10 * 2 ** 20)))
+MAX_MESSAGE_BYTES = int(os.getenv("MAX_MESSAGE_BYTES", str(50 * 2 ** 20)))  # all IGC attachments of one message
+ARCHIVE_IGC = os.getenv("ARCHIVE_IGC", "1") != "0"  # 0: received IGC files are only kept in memory
+ARCHIVE_DIR = LOG_DIR / "igc"
 
 
-def send_error_notification(sender, filename, error):
+def error_notification(sender, filename, error):
     msg = MIMEText(
         f"Error processing IGC file from {sender}\n\n"
         f"File: {filename}\n"
@@ -42,10 +65,7 @@ def send_error_notification(sender, filename, error):
     msg["From"] = IMAP_USER
     msg["To"] = ERROR_NOTIFY
     msg["Subject"] = f"Wander Bot Error — {filename}"
-    try:
-        send_reply(msg)
-    except Exception as e:
-        print(f"Failed to send error notification: {e}")
+    return msg
 
 
 def log_processing(sender, filename):
@@ -55,112 +75,408 @@ def log_processing(sender, filename):
 
 
 def connect():
-    mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-    mail.login(IMAP_USER, IMAP_PASS)
-    mail.select("INBOX")
-    return mail
+    return inbox.connect(IMAP_SERVER, IMAP_USER, IMAP_PASS, IMAP_PORT, IMAP_SSL)
 
 
-def build_reply(sender, filename, body, kml_path):
+def build_reply(sender, filename, body, kmz=None, html_body=None):
+    # kmz: the track as kmz bytes, attached as <igc name>.kmz; html_body: sent alongside the plain
+    # text body (multipart/alternative), mail clients show the one they prefer
     reply = MIMEMultipart("mixed")
     reply["From"] = IMAP_USER
     reply["To"] = sender
     reply["Subject"] = f"Analysis of your flight: {filename}"
-    reply.attach(MIMEText(body, "plain"))
-
-    if kml_path and os.path.exists(kml_path):
-        with open(kml_path, "rb") as f:
-            attachment = MIMEBase("application", "vnd.google-earth.kml+xml")
-            attachment.set_payload(f.read())
+    if html_body:
+        text = MIMEMultipart("alternative")
+        text.attach(MIMEText(body, "plain"))
+        text.attach(MIMEText(html_body, "html"))
+        reply.attach(text)
+    else:
+        reply.attach(MIMEText(body, "plain"))
+
+    if kmz:
+        attachment = MIMEBase("application", "vnd.google-earth.kmz")
+        attachment.set_payload(kmz)
         encoders.encode_base64(attachment)
         attachment.add_header(
             "Content-Disposition",
             "attachment",
-            filename=os.path.basename(kml_path),
+            filename=f"{Path(filename).stem}.kmz",
         )
         reply.attach(attachment)
 
     return reply
 
 
-def send_reply(reply_email):
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-        smtp.starttls()
-        smtp.login(IMAP_USER, IMAP_PASS)
-        smtp.send_message(reply_email)
+_archiver = None
 
 
-def process_igc(part, envelope, igc_path, note=""):
-    filename = part.get_filename()
-    sender = envelope.get("From", "")
+def archive_igc(filename, payload, on_done=None):
+    # keep a copy of the received file in Log/igc without holding up the reply; the name is unique
+    # per upload (time & content hash), so same-named files from different pilots do not collide.
+    # on_done() runs once the copy is written
+    global _archiver
+    if _archiver is None:
+        _archiver = ThreadPoolExecutor(max_workers=1)
+    name = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{hashlib.sha1(payload).hexdigest()[:8]}-{Path(filename).name}"
 
-    results = load_igc(igc_path)
+    def write():
+        try:
+            ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+            with open(ARCHIVE_DIR / name, "wb") as f:
+                f.write(payload)
+        except OSError as e:
+            print(f"Could not archive {filename}: {e}")
+            return
+        if on_done is not None:
+            on_done()
 
-    buf = io.StringIO()
-    with redirect_stdout(buf):
-        display_summary_stats(results)
-    body = re.sub(r'\033\[[0-9;]*m', '', buf.getvalue())
+    _archiver.submit(write)
 
-    display_summary_stats(results)
 
-    if note:
-        body += f"\n{note}\n"
+_outbox = None
 
-    kml_path = igc_path.rsplit(".", 1)[0] + ".kml"
-    create_enhanced_kml(results["kml_data"])
 
-    if os.path.exists(kml_path):
-        reply = build_reply(sender, filename, body, kml_path)
-        send_reply(reply)
+def get_outbox():
+    # the one SMTP session of this process (created on first use)
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox(SMTP_SERVER, SMTP_PORT, IMAP_USER if SMTP_AUTH else None, IMAP_PASS, SMTP_STARTTLS,
+                         batch_size=SMTP_BATCH)
+    return _outbox
 
-    log_processing(sender, filename)
 
+def send_reply(reply_email):
+    get_outbox().send(reply_email)
 
-def fetch_igc_attachments(mail):
-    result, data = mail.search(None, "UNSEEN")
-    if result != "OK":
-        return
 
-    for num in data[0].split():
-        result, msg_data = mail.fetch(num, "(RFC822)")
-        if result != "OK":
+def igc_attachments(msg):
+    igc_parts = []
+    for part in msg.walk():
+        if part.get_content_maintype() == "multipart":
+            continue
+        if part.get("Content-Disposition") is None:
             continue
+        filename = part.get_filename()
+        if filename and filename.lower().endswith(".igc"):
+            igc_parts.append(part)
+    return igc_parts
+
+
+def message_flights(msg):
+    # [(filename, payload)] of the message's IGC attachments within the per-message limits, and
+    # notes for the pilot about the files that were left out
+    flights, notes = [], []
+    total = 0
+    igc_parts = igc_attachments(msg)
+    for part in igc_parts[:MAX_ATTACHMENTS]:
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if len(payload) > MAX_ATTACHMENT_BYTES:
+            notes.append(f"{filename} was not processed: larger than {MAX_ATTACHMENT_BYTES / 2 ** 20:g} MB.")
+        elif total + len(payload) > MAX_MESSAGE_BYTES:
+            notes.append(f"{filename} was not processed: the attachments exceed {MAX_MESSAGE_BYTES / 2 ** 20:g} MB.")
+        else:
+            total += len(payload)
+            flights.append((filename, bytes(payload)))
+    if len(igc_parts) > MAX_ATTACHMENTS:
+        notes.append(f"Only {MAX_ATTACHMENTS} IGC files per email are processed; "
+                     f"{len(igc_parts) - MAX_ATTACHMENTS} more were ignored.")
+    return flights, notes
+
+
+def analyze_flight(sender, filename, payload):
+    # runs in a worker process: one IGC attachment -> its report (footer left to the reply) & kmz, from
+    # the attachment bytes; a copy of an upload answered within REPLY_CACHE_WINDOW_S gets the stored ones
+    flight = {"filename": filename, "report": None, "kmz": None, "error": None, "kmz_error": None,
+              "reply_cache": None}  # 'hit' / 'miss', counted by the main process (None: cache disabled)
+    try:
+        print(f"Processing: {filename} from {sender}")
+        fp = replies.fingerprint(payload)
+        cached = replies.lookup(fp)
+        if replies.REPLY_CACHE_WINDOW_S > 0:
+            flight["reply_cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            print(f"Duplicate of {cached['filename']}, answered from the reply cache")
+            flight["report"], flight["kmz"] = cached["report"], cached["kmz"]
+        else:
+            results = load_igc_cached(payload, name=filename)
+            flight["report"] = build_report(results, footer=False)  # formatted once, rendered per output
+            print(render_report(flight["report"], "ansi"), end="")
+            try:
+                flight["kmz"] = kmz_bytes(results["kml_data"])
+            except Exception as e:  # the report still goes out, the reply says the map is missing
+                print(f"Error building the map of {filename}: {e}")
+                flight["kmz_error"] = e
+            if flight["kmz"]:
+                replies.store(fp, flight["report"], flight["kmz"], filename)
+        log_processing(sender, filename if cached is None else f"{filename} (duplicate)")
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+        flight["error"] = e
+    return flight
+
+
+def build_message_reply(sender, flights, notes):
+    # (reply, notices): one reply for all of a message's flights (a day summary first when there are
+    # several, one kmz with every track; None when there is nothing to send the pilot) & an error
+    # notification per failed file or map
+    analyzed = [f for f in flights if f["report"] is not None]
+    failed = [f for f in flights if f["report"] is None]
+    no_map = [f for f in analyzed if f.get("kmz_error") is not None]
+    notes = notes + [f"{f['filename']} could not be analyzed." for f in failed]
+    notes += [f"The map (kmz) of {f['filename']} could not be built." for f in no_map]
+    notices = [error_notification(sender, f["filename"], f["error"]) for f in failed]
+    notices += [error_notification(sender, f["filename"], f"kmz: {f['kmz_error']}") for f in no_map]
+    if not analyzed:  # failures only go to ERROR_NOTIFY; files left out by the limits are explained
+        if notes and not failed:
+            return build_reply(sender, "no files processed", "\n".join(notes) + "\n"), notices
+        return None, notices
+
+    if len(analyzed) == 1:
+        report = flight_report(analyzed[0]["report"], notes)
+        name = analyzed[0]["filename"]
+    else:
+        report = build_day_report([f["report"] for f in analyzed], notes)
+        name = f"{len(analyzed)} flights of {report['summary']['flights'][0]['date']}"
+    tracks = [(f["filename"], f["kmz"]) for f in analyzed if f["kmz"]]
+    kmz = combine_kmz(tracks, name) if tracks else None
+    reply = build_reply(sender, name, render_report(report), kmz, render_report(report, "html"))
+    return reply, notices
+
+
+def new_jobs():
+    # worker pool & bookkeeping shared by the poll and IDLE loops
+    wake_r, wake_w = socket.socketpair()  # a finished job wakes an IDLE wait
+    journal = Journal()
+    journal.prune()
+    unfinished = {k: v for k, v in journal.counts().items() if k != "done"}
+    if unfinished:
+        print(f"Journal: resuming {unfinished}")
+    return {"pool": ProcessPoolExecutor(max_workers=WORKERS),
+            "journal": journal,  # what happened to each message, across restarts
+            "in_flight": set(),  # UIDs queued or being processed
+            "done": queue.Queue(),  # (uid, error) of finished jobs, flagged on the IMAP session
+            "slots": threading.BoundedSemaphore(QUEUE_SIZE),
+            "reply_cache": {"hit": 0, "miss": 0},  # lookups of the analyzed attachments
+            "wake": wake_r,
+            "wake_w": wake_w}
+
+
+def restart_pool(jobs):
+    # a worker died: start a fresh pool, the messages it held are retried
+    jobs["pool"].shutdown(wait=False, cancel_futures=True)
+    jobs["pool"] = ProcessPoolExecutor(max_workers=WORKERS)
+
+
+def journal_write(jobs, change, uid, *args):
+    # a failed journal write is reported but does not stop the job (it is only redone after a crash)
+    try:
+        return getattr(jobs["journal"], change)(uid.decode(), *args)
+    except Exception as e:
+        print(f"Journal error ({change} {uid.decode()}): {e}")
 
-        raw_email = msg_data[0][1]
-        msg = email.message_from_bytes(raw_email)
 
-        igc_parts = []
-        for part in msg.walk():
-            if part.get_content_maintype() == "multipart":
-                continue
-            if part.get("Content-Disposition") is None:
-                continue
-            filename = part.get_filename()
-            if filename and filename.lower().endswith(".igc"):
-                igc_parts.append(part)
+def submit_message(jobs, uid, msg):
+    # journal a new message & start its job
+    flights, notes = message_flights(msg)
+    sender = msg.get("From", "")
+    journal_write(jobs, "received", uid, sender, flights, notes)
+    archive_flights(jobs, uid, [(i, filename, payload) for i, (filename, payload) in enumerate(flights)])
+    start_job(jobs, uid, sender, flights, notes)
 
-        if not igc_parts:
-            continue
 
-        part = igc_parts[0]
-        filename = part.get_filename()
-        note = "Only 1 file per email is processed; additional IGC files were ignored." if len(igc_parts) > 1 else ""
+def resume_message(jobs, uid):
+    # a job the journal has as received / analyzed: stored results are kept, the rest is redone
+    sender, notes, flights, results, notified = jobs["journal"].load(uid.decode())
+    archive_flights(jobs, uid, jobs["journal"].unarchived(uid.decode()))  # cut short by a crash
+    start_job(jobs, uid, sender, flights, notes, results, notified)
 
-        igc_path = str(LOG_DIR / filename)
-        payload = part.get_payload(decode=True)
-        if isinstance(payload, str):
-            payload = payload.encode()
-        with open(igc_path, "wb") as f:
-            f.write(bytes(payload))
 
+def archive_flights(jobs, uid, flights):
+    # archive a message's attachments [(idx, filename, payload)] once, journaled as each copy is written,
+    # so retries & resumed jobs do not archive them again
+    if not ARCHIVE_IGC:
+        return
+    for i, filename, payload in flights:
+        archive_igc(filename, payload, lambda i=i: journal_write(jobs, "archived", uid, i))
+
+
+def start_job(jobs, uid, sender, flights, notes, results=None, notified=False):
+    # fan the attachments that still need analysis out over the pool; the reply is built once the last is done
+    results = results or [None] * len(flights)
+    todo = [i for i, result in enumerate(results) if result is None]
+    state = {"sender": sender, "notes": notes, "flights": results, "pending": len(todo), "error": None,
+             "notified": notified, "abandoned": False, "lock": threading.Lock()}
+    if not todo:
+        return message_finished(jobs, uid, state)
+    futures = []
+    try:
+        for i in todo:
+            filename, payload = flights[i]
+            futures.append((i, jobs["pool"].submit(analyze_flight, sender, filename, payload)))
+    except BaseException:  # all or nothing: the caller frees the slot, the message is retried
+        with state["lock"]:
+            state["abandoned"] = True
+        for _, future in futures:
+            future.cancel()
+        raise
+    for i, future in futures:
+        future.add_done_callback(lambda f, i=i: flight_finished(jobs, uid, state, i, f))
+
+
+def flight_finished(jobs, uid, state, i, future):
+    with state["lock"]:
+        if state["abandoned"]:
+            return
         try:
-            print(f"Processing: {filename} from {msg['From']}")
-            process_igc(part, msg, igc_path, note)
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-            send_error_notification(msg["From"], filename, e)
+            state["flights"][i] = future.result()
+            journal_write(jobs, "analyzed", uid, i, state["flights"][i])
+            if state["flights"][i].get("reply_cache"):
+                jobs["reply_cache"][state["flights"][i]["reply_cache"]] += 1
+        except Exception as e:  # worker died
+            state["error"] = state["error"] or e
+        state["pending"] -= 1
+        if state["pending"]:
+            return
+    if state["error"] is not None:
+        return reply_sent(jobs, uid, state["error"])
+    message_finished(jobs, uid, state)
+
+
+def message_finished(jobs, uid, state):
+    # all attachments done: queue the reply & the error notifications (once per message, not per retry);
+    # the job is finished once the reply was sent, or the notifications when there is no reply
+    try:
+        reply, notices = build_message_reply(state["sender"], state["flights"], state["notes"])
+    except Exception as e:
+        return reply_sent(jobs, uid, e)
+    if state["notified"]:
+        notices = []
+    if reply is None:
+        return send_notices(jobs, uid, notices, lambda: reply_sent(jobs, uid, None))
+    get_outbox().put(reply, lambda error: reply_sent(jobs, uid, error))
+    send_notices(jobs, uid, notices)
+
+
+def send_notices(jobs, uid, notices, then=None):
+    # queue the error notifications, journaled as sent once the outbox is done with them (sent or given
+    # up on, they are not retried with the job); then() runs after that
+    left = [len(notices)]
+
+    def on_done(error):  # outbox callbacks run one at a time on its thread
+        if error is not None:
+            print(f"Error notification for message {uid.decode()} not sent: {error}")
+        left[0] -= 1
+        if left[0] == 0:
+            journal_write(jobs, "notified", uid)
+            if then is not None:
+                then()
+
+    if not notices:
+        return then() if then is not None else None
+    for msg in notices:
+        get_outbox().put(msg, on_done)
+
+
+def job_failed(jobs, uid, error):
+    # count a failed attempt (journaled with its retry time, the delay doubling per attempt); True when
+    # the message is given up on: a permanent SMTP error (5xx, refused recipient) fails the same way
+    # every time, anything else gets JOB_MAX_ATTEMPTS tries
+    if is_permanent(error):
+        return True
+    attempts = journal_write(jobs, "failed", uid, RETRY_DELAY_S, MAX_RETRY_DELAY_S)
+    return attempts is not None and attempts >= JOB_MAX_ATTEMPTS
+
+
+def reply_sent(jobs, uid, error):
+    # the job's outcome: replied, given up on (flagged \Seen like a replied message) or retried later
+    final = error is None or job_failed(jobs, uid, error)
+    if error is None:
+        journal_write(jobs, "replied", uid)
+    jobs["slots"].release()
+    jobs["done"].put((uid, error, final))
+    try:
+        jobs["wake_w"].send(b"!")
+    except OSError:
+        pass
+
 
-        mail.store(num, "+FLAGS", "\\Seen")
+def finish_message(mail, jobs, uid, error=None):
+    # \Seen & done: replied, or given up on
+    if error is not None:
+        print(f"Giving up on message {uid.decode()}: {error}")
+    mail.uid("STORE", uid, "+FLAGS", "(\\Seen)")
+    journal_write(jobs, "done", uid)
+
+
+def mark_done(mail, jobs):
+    # flag the messages whose jobs finished as \Seen; failed jobs stay unseen until their retry is due
+    finished = 0
+    while True:
+        try:
+            uid, error, final = jobs["done"].get_nowait()
+        except queue.Empty:
+            break
+        jobs["in_flight"].discard(uid)
+        finished += 1
+        if not final:
+            print(f"Job for message {uid.decode()} failed, will retry: {error}")
+            continue
+        finish_message(mail, jobs, uid, error)
+    if finished:
+        print(f"Outbox: {get_outbox().metrics()}, reply cache: {jobs['reply_cache']}")
+
+
+def queue_job(mail, jobs, uid, start, *args):
+    # start(jobs, uid, *args) once a slot is free; blocks while QUEUE_SIZE jobs are pending
+    while not jobs["slots"].acquire(timeout=1):  # backpressure: wait for a free slot, flagging finished jobs
+        mark_done(mail, jobs)
+    jobs["in_flight"].add(uid)
+    try:
+        start(jobs, uid, *args)
+    except BaseException as e:  # no job was started, so nothing else will free the slot
+        jobs["in_flight"].discard(uid)
+        jobs["slots"].release()
+        if isinstance(e, BrokenProcessPool) or not isinstance(e, Exception):
+            raise
+        print(f"Could not start the job for message {uid.decode()}: {e}")
+        if job_failed(jobs, uid, e):
+            finish_message(mail, jobs, uid, e)
+    mark_done(mail, jobs)
+
+
+def fetch_igc_attachments(mail, jobs):
+    # hand each unseen IGC message to the worker pool. The journal decides what is left to do: a message
+    # replied to before a crash is only flagged, a journaled job resumes without fetching the message again
+    mark_done(mail, jobs)
+    result, data = mail.uid("SEARCH", None, "UNSEEN")
+    if result != "OK":
+        return
+
+    for uid in data[0].split():
+        if uid in jobs["in_flight"]:
+            continue
+        state = jobs["journal"].state(uid.decode())
+        if state == "replied":
+            finish_message(mail, jobs, uid)
+            continue
+        if state != "done" and jobs["journal"].retry_at(uid.decode()) > time.time():
+            continue  # failed before, its retry is not due yet
+        if state in ("received", "analyzed"):
+            queue_job(mail, jobs, uid, resume_message)
+            continue
+
+        result, msg_data = mail.uid("FETCH", uid, "(BODY.PEEK[])")  # PEEK: \Seen is set once the job is done
+        if result != "OK" or not msg_data or msg_data[0] is None:
+            continue
+
+        msg = email.message_from_bytes(msg_data[0][1])
+        if not igc_attachments(msg):
+            mail.uid("STORE", uid, "+FLAGS", "(\\Seen)")
+            continue
+        queue_job(mail, jobs, uid, submit_message, msg)
 
 
 def send_weekly_summary():
@@ -192,33 +508,83 @@ def send_weekly_summary():
     log_path.unlink()
 
 
-def poll_forever():
-    print(f"Monitoring {IMAP_USER} every {POLL_INTERVAL}s ...")
+def check_weekly_summary():
+    today = datetime.date.today()
+    if today.weekday() == 5:
+        last_report = None
+        if LAST_REPORT_FILE.exists():
+            last_report = LAST_REPORT_FILE.read_text().strip()
+        if last_report != str(today):
+            print("Sending weekly summary ...")
+            try:
+                send_weekly_summary()
+                LAST_REPORT_FILE.write_text(str(today))
+            except Exception as e:
+                print(f"Weekly summary error: {e}")
+
+
+def poll_forever(jobs=None):
+    print(f"Monitoring {IMAP_USER} every {POLL_INTERVAL}s with {WORKERS} workers ...")
+    jobs = jobs or new_jobs()
     while True:
+        mail = None
         try:
             mail = connect()
-            fetch_igc_attachments(mail)
-            mail.logout()
+            fetch_igc_attachments(mail, jobs)
+        except BrokenProcessPool as e:
+            print(f"Worker pool error: {e}")
+            restart_pool(jobs)
         except Exception as e:
             print(f"Connection error: {e}")
+        if mail is not None:
+            inbox.logout(mail)
 
-        today = datetime.date.today()
-        if today.weekday() == 5:
-            last_report = None
-            if LAST_REPORT_FILE.exists():
-                last_report = LAST_REPORT_FILE.read_text().strip()
-            if last_report != str(today):
-                print("Sending weekly summary ...")
-                try:
-                    send_weekly_summary()
-                    LAST_REPORT_FILE.write_text(str(today))
-                except Exception as e:
-                    print(f"Weekly summary error: {e}")
-
+        check_weekly_summary()
         time.sleep(POLL_INTERVAL)
 
 
+def idle_timeout(jobs):
+    # IDLE_TIMEOUT, cut short to wake up when the next failed job is due for a retry
+    next_retry = jobs["journal"].next_retry()
+    if next_retry is None:
+        return IDLE_TIMEOUT
+    return min(IDLE_TIMEOUT, max(1, next_retry - time.time() + 1))
+
+
+def idle_forever():
+    # push mode: one logged-in session, woken by IMAP IDLE when mail arrives or a job finishes;
+    # reconnects with exponential backoff, and polls if the server has no IDLE
+    print(f"Monitoring {IMAP_USER} with IMAP IDLE and {WORKERS} workers ...")
+    jobs = new_jobs()
+    backoff = 1
+    while True:
+        mail = None
+        try:
+            mail = connect()
+            if not inbox.supports_idle(mail):
+                print("Server has no IDLE, polling instead")
+                inbox.logout(mail)
+                return poll_forever(jobs)
+            backoff = 1
+            while True:
+                fetch_igc_attachments(mail, jobs)
+                check_weekly_summary()
+                inbox.idle(mail, idle_timeout(jobs), jobs["wake"])
+        except BrokenProcessPool as e:
+            print(f"Worker pool error: {e}")
+            restart_pool(jobs)
+        except Exception as e:
+            print(f"Connection error: {e}, reconnecting in {backoff}s")
+            if mail is not None:  # close the stale session before opening the next one
+                inbox.logout(mail)
+                mail = None
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        if mail is not None:
+            inbox.logout(mail)
+
+
 if __name__ == "__main__":
-    poll_forever()
+    idle_forever() if MAIL_MODE == "idle" else poll_forever()
 
 # RUN: nohup python3 _wander_bot.py &
\ No newline at end of file